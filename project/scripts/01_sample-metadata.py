@@ -10,10 +10,15 @@ Task 1: Sample Metadata
 - Creates QIIME2 visualization using metadata tabulate
 """
 
+import csv
+import logging
 import os
+import numpy as np
 import pandas as pd
 from qiime2 import Metadata
 
+log = logging.getLogger(__name__)
+
 # Define paths
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATA_RAW_DIR = os.path.join(BASE_DIR, 'data', 'raw')
@@ -26,22 +31,81 @@ OUTPUT_DIR = os.path.join(BASE_DIR, 'outputs', '01_metadata')
 os.makedirs(DATA_PROCESSED_DIR, exist_ok=True)
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+# Column dtypes applied while parsing the workbook
+# (nullable Int64/Float64 keep empty cells as <NA> without upcasting)
+EXCEL_DTYPES = {
+    'Abbr': 'string',
+    'Horse': 'string',
+    'Type': 'string',
+    'Tooth location': 'string',
+    'disease state': 'string',
+    'Gender': 'string',
+    'Age': 'Float64',
+    'DIN': 'Float64',
+    'Seq Pos': 'Int64',
+    'Tooth #': 'Int64',
+    'Replicate': 'Int64'
+}
+
+# Sample types assigned to the control subjects (after anonymization)
+CONTROL_SAMPLE_TYPES = {
+    'E-coli': 'Positive-Control',
+    'H2O': 'Negative-Control'
+}
+
+# Placeholders for empty cells, parsed as missing values
+MISSING_VALUES = ['n/a', 'NA', 'N/A', '-']
+
+def read_metadata_workbook(path):
+    """
+    Read the first sheet of the metadata workbook.
+    
+    The first spreadsheet row is a title, the column headers are in the
+    second row. Uses the fast calamine engine and falls back to a read-only
+    openpyxl workbook if calamine is unavailable or rejects the file. The
+    EXCEL_DTYPES are applied after parsing, so a bad cell value is reported
+    once instead of triggering the fallback.
+    """
+    try:
+        # One handle for the workbook; parse further sheets from `xl` as needed
+        with pd.ExcelFile(path, engine='calamine') as xl:
+            df = xl.parse(0, header=1, na_values=MISSING_VALUES)
+    except (ImportError, ValueError) as e:
+        print(f"  calamine could not read the workbook ({e})")
+        print("  Falling back to openpyxl (read-only)...")
+        
+        from openpyxl import load_workbook
+        
+        wb = load_workbook(path, read_only=True, data_only=True, keep_links=False)
+        try:
+            rows = list(wb.worksheets[0].values)
+        finally:
+            wb.close()
+        
+        df = pd.DataFrame(rows[2:], columns=rows[1])
+        df = df.replace(MISSING_VALUES, None)
+    
+    for col, dtype in EXCEL_DTYPES.items():
+        if col not in df.columns:
+            continue
+        try:
+            df[col] = df[col].astype(dtype)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Column '{col}' in {path} is not {dtype}: {e}") from e
+    return df
+
 def convert_excel_to_qiime_metadata():
     """Convert Excel metadata file to QIIME2-compatible TSV format."""
     
     print("Reading Excel metadata file...")
     print(f"Input: {EXCEL_FILE}")
     
-    # Read Excel file
-    df = pd.read_excel(EXCEL_FILE)
+    # Read Excel file (headers are in the second spreadsheet row)
+    df = read_metadata_workbook(EXCEL_FILE)
     
-    # The actual headers are in the first row
-    new_columns = df.iloc[0].tolist()
-    df = df[1:].reset_index(drop=True)
-    df.columns = new_columns
-    
-    print(f"Original shape: {df.shape}")
-    print(f"Original columns: {list(df.columns)}")
+    log.info("Original shape: %s", df.shape)
+    if log.isEnabledFor(logging.INFO):
+        log.info("Original columns: %s", list(df.columns))
     
     # Rename columns to QIIME2-compatible format (no spaces, lowercase with hyphens)
     column_mapping = {
@@ -60,7 +124,8 @@ def convert_excel_to_qiime_metadata():
     
     df = df.rename(columns=column_mapping)
     
-    print(f"\nOriginal subject names: {df['subject'].unique()}")
+    if log.isEnabledFor(logging.INFO):
+        log.info("\nOriginal subject names: %s", df['subject'].unique())
     
     # Anonymize horse names and ensure QIIME2-compatible naming (no spaces)
     subject_mapping = {
@@ -71,55 +136,54 @@ def convert_excel_to_qiime_metadata():
         'H2O': 'H2O'           # Negative control
     }
     
-    df['subject'] = df['subject'].map(subject_mapping)
+    # Rename the categories rather than every row. rename_categories keeps
+    # unmapped names, so refuse to continue rather than write a real name
+    subjects = pd.Categorical(df['subject'])
+    unmapped = set(subjects.categories) - subject_mapping.keys()
+    if unmapped:
+        raise ValueError(f"Subjects without an anonymized name: {sorted(unmapped)}")
+    df['subject'] = subjects.rename_categories(subject_mapping)
     
-# Set 'sample-type' for controls 
-    # For positive control (E-coli)
-    df.loc[df['subject'] == 'E-coli', 'sample-type'] = 'Positive-Control'
+    # Set 'sample-type' for controls in one vectorized pass
+    # (E-coli = positive control, H2O = negative control)
+    df['sample-type'] = pd.Categorical(np.select(
+        [df['subject'].eq(subject) for subject in CONTROL_SAMPLE_TYPES],
+        list(CONTROL_SAMPLE_TYPES.values()),
+        default=df['sample-type'].astype(object)
+    ))
     
-    # For negative control (H2O)
-    df.loc[df['subject'] == 'H2O', 'sample-type'] = 'Negative-Control'
-
-
-    print(f"Anonymized subject names: {df['subject'].unique()}")
+    if log.isEnabledFor(logging.INFO):
+        log.info("Anonymized subject names: %s", df['subject'].unique())
     
     # Set sample-id as index
     df = df.set_index('sample-id')
     
-    print(f"\nProcessed metadata:")
-    print(f"Number of samples: {len(df)}")
-    print(f"Columns: {list(df.columns)}")
-    print(f"\nSample breakdown:")
-    print(f"  Subjects: {df['subject'].unique()}")
-    print(f"  Disease states: {df['disease-state'].unique()}")
-    print(f"  Sample types: {df['sample-type'].unique()}")
-    
-    # Convert numeric columns to appropriate types
-    df['age'] = pd.to_numeric(df['age'], errors='coerce')
-    df['din'] = pd.to_numeric(df['din'], errors='coerce')
-    df['seq-pos'] = pd.to_numeric(df['seq-pos'], errors='coerce')
-    df['tooth-number'] = pd.to_numeric(df['tooth-number'], errors='coerce')
-    df['replicate'] = pd.to_numeric(df['replicate'], errors='coerce')
-    
-    # Define column types for QIIME2
-    column_types = []
-    for col in df.columns:
-        # Check for column type based on potential usage in QIIME 2
-        # 'sample-type' is now explicitly categorical for control/real samples
-        if col in ['age', 'din', 'seq-pos', 'tooth-number', 'replicate']:
-            column_types.append('numeric')
-        else:
-            column_types.append('categorical')
-    
-    # Write metadata file with QIIME2 header
-    with open(METADATA_TSV, 'w') as f:
+    log.info("\nProcessed metadata:")
+    log.info("Number of samples: %d", len(df))
+    if log.isEnabledFor(logging.INFO):
+        log.info("Columns: %s", list(df.columns))
+        log.info("\nSample breakdown:")
+        log.info("  Subjects: %s", df['subject'].unique())
+        log.info("  Disease states: %s", df['disease-state'].unique())
+        log.info("  Sample types: %s", df['sample-type'].unique())
+    
+    # Define column types for QIIME2 (numeric dtypes were set while reading)
+    column_types = [
+        'numeric' if pd.api.types.is_numeric_dtype(dtype) else 'categorical'
+        for dtype in df.dtypes
+    ]
+    
+    # Write metadata file with QIIME2 header in a single pass
+    # (missing values are written as empty cells, as QIIME2 expects)
+    rows = df.astype(object).where(df.notna(), '')
+    with open(METADATA_TSV, 'w', newline='', buffering=1 << 20) as f:
+        writer = csv.writer(f, delimiter='\t', lineterminator='\n')
         # Write header with sample-id
-        f.write('sample-id\t' + '\t'.join(df.columns) + '\n')
+        writer.writerow(['sample-id'] + list(df.columns))
         # Write column types (required by QIIME2)
-        f.write('#q2:types\t' + '\t'.join(column_types) + '\n')
-    
-    # Append data
-    df.to_csv(METADATA_TSV, sep='\t', mode='a', header=False)
+        writer.writerow(['#q2:types'] + column_types)
+        # Write data
+        writer.writerows(rows.itertuples(index=True, name=None))
     
     print(f"\n✓ Metadata TSV file created: {METADATA_TSV}")
     
@@ -136,10 +200,11 @@ def create_metadata_visualization(metadata_file):
     print(f"Loading metadata from: {metadata_file}")
     metadata = Metadata.load(metadata_file)
     
-    print(f"\nLoaded metadata:")
-    print(f"  Number of samples: {len(metadata.ids)}")
-    print(f"  Sample IDs (first 10): {list(metadata.ids)[:10]}")
-    print(f"  Metadata columns: {list(metadata.columns.keys())}")
+    log.info("\nLoaded metadata:")
+    log.info("  Number of samples: %d", len(metadata.ids))
+    if log.isEnabledFor(logging.INFO):
+        log.info("  Sample IDs (first 10): %s", list(metadata.ids)[:10])
+        log.info("  Metadata columns: %s", list(metadata.columns.keys()))
     
     # Create visualization using QIIME2's metadata tabulate
     print("\nGenerating tabulate visualization...")
@@ -182,4 +247,10 @@ def main():
     print("="*60)
 
 if __name__ == "__main__":
+    # Detailed metadata exploration is logged at INFO;
+    # set LOGLEVEL=WARNING (e.g. in CI) to skip it
+    logging.basicConfig(
+        level=os.environ.get('LOGLEVEL', 'INFO').upper(),
+        format='%(message)s'
+    )
     main()
\ No newline at end of file
@@ -9,8 +9,8 @@ Task 2: Data Import
 - Outputs: paired-end-sequences.qza artifact
 """
 
+import csv
 import os
-import pandas as pd
 from qiime2 import Artifact
 
 # Define paths
@@ -21,6 +21,9 @@ METADATA_FILE = os.path.join(DATA_PROCESSED_DIR, 'sample-metadata.tsv')
 MANIFEST_FILE = os.path.join(DATA_PROCESSED_DIR, 'manifest.tsv')
 OUTPUT_DIR = os.path.join(BASE_DIR, 'outputs', '02_import')
 
+# Manifest header (PairedEndFastqManifestPhred33V2 format)
+MANIFEST_COLUMNS = ['sample-id', 'forward-absolute-filepath', 'reverse-absolute-filepath']
+
 # Create directories
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
@@ -30,45 +33,55 @@ def create_manifest():
     print("Creating manifest file for paired-end FASTQ files...")
     print(f"Scanning directory: {DATA_RAW_DIR}")
     
-    # Read metadata to get sample IDs
-    metadata = pd.read_csv(METADATA_FILE, sep='\t', comment='#', index_col=0)
-    sample_ids = metadata.index.tolist()
+    # Read sample IDs (first column) from the metadata, skipping the
+    # header and any '#' directive rows such as '#q2:types'
+    with open(METADATA_FILE, newline='') as f:
+        reader = csv.reader(f, delimiter='\t')
+        next(reader)
+        sample_ids = [row[0] for row in reader if row and not row[0].startswith('#')]
     
     print(f"Found {len(sample_ids)} samples in metadata")
     
+    # List the raw-data directory once instead of stat-ing every file
+    available_files = {
+        entry.name for entry in os.scandir(DATA_RAW_DIR) if entry.is_file()
+    }
+    
     # Create manifest entries
-    manifest_data = []
+    manifest_rows = []
     missing_files = []
     
     for sample_id in sample_ids:
         # Expected file names: SAMPLEID_1.fastq.gz and SAMPLEID_2.fastq.gz
-        forward_file = os.path.join(DATA_RAW_DIR, f"{sample_id}_1.fastq.gz")
-        reverse_file = os.path.join(DATA_RAW_DIR, f"{sample_id}_2.fastq.gz")
+        forward_name = f"{sample_id}_1.fastq.gz"
+        reverse_name = f"{sample_id}_2.fastq.gz"
+        forward_file = os.path.join(DATA_RAW_DIR, forward_name)
+        reverse_file = os.path.join(DATA_RAW_DIR, reverse_name)
         
         # Check if files exist
-        if os.path.exists(forward_file) and os.path.exists(reverse_file):
-            manifest_data.append({
-                'sample-id': sample_id,
-                'forward-absolute-filepath': forward_file,
-                'reverse-absolute-filepath': reverse_file
-            })
+        has_forward = forward_name in available_files
+        has_reverse = reverse_name in available_files
+        if has_forward and has_reverse:
+            manifest_rows.append((sample_id, forward_file, reverse_file))
         else:
             missing_files.append(sample_id)
-            if not os.path.exists(forward_file):
+            if not has_forward:
                 print(f"  WARNING: Missing forward read: {forward_file}")
-            if not os.path.exists(reverse_file):
+            if not has_reverse:
                 print(f"  WARNING: Missing reverse read: {reverse_file}")
     
     if missing_files:
         print(f"\n⚠️  Missing FASTQ files for {len(missing_files)} samples: {missing_files}")
         raise FileNotFoundError(f"Missing files for samples: {missing_files}")
     
-    # Create DataFrame and save manifest
-    manifest_df = pd.DataFrame(manifest_data)
-    manifest_df.to_csv(MANIFEST_FILE, sep='\t', index=False)
+    # Save manifest
+    with open(MANIFEST_FILE, 'w', newline='') as f:
+        writer = csv.writer(f, delimiter='\t', lineterminator='\n')
+        writer.writerow(MANIFEST_COLUMNS)
+        writer.writerows(manifest_rows)
     
     print(f"\n✓ Manifest file created: {MANIFEST_FILE}")
-    print(f"  Total samples: {len(manifest_data)}")
+    print(f"  Total samples: {len(manifest_rows)}")
     
     return MANIFEST_FILE
 
@@ -14,15 +14,8 @@ INPUT_DIR = os.path.join(BASE_DIR, 'outputs', '04_denoising')
 OUTPUT_DIR = INPUT_DIR
 STATS_FILE = os.path.join(INPUT_DIR, 'denoising-stats.qza')
 
-def visualize_stats():
-    """Create visualization of DADA2 denoising statistics."""
-    
-    print("="*60)
-    print("Visualizing DADA2 Denoising Stats")
-    print("="*60)
-    
-    # Load the denoising-stats.qza artifact
-    denoising_stats = Artifact.load(STATS_FILE)
+def tabulate_stats(denoising_stats):
+    """Tabulate an already-loaded denoising-stats artifact."""
     
     # Convert to metadata
     stats_md = denoising_stats.view(Metadata)
@@ -35,6 +28,20 @@ def visualize_stats():
     stats_viz.save(viz_path)
     
     print(f"\n✓ Saved: {viz_path}")
+    
+    return viz_path
+
+def visualize_stats():
+    """Create visualization of DADA2 denoising statistics."""
+    
+    print("="*60)
+    print("Visualizing DADA2 Denoising Stats")
+    print("="*60)
+    
+    # Load the denoising-stats.qza artifact
+    denoising_stats = Artifact.load(STATS_FILE)
+    
+    return tabulate_stats(denoising_stats)
 
 if __name__ == "__main__":
     visualize_stats()
\ No newline at end of file
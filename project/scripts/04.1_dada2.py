@@ -28,6 +28,8 @@ TRUNC_LEN_F = 270
 TRUNC_LEN_R = 240
 TRIM_LEFT_F = 0
 TRIM_LEFT_R = 0
+CHIMERA_METHOD = 'consensus'
+N_THREADS = 0  # 0 = use all available cores
 
 def denoise_with_dada2(sequences_path):
     """Denoise sequences using DADA2."""
@@ -44,6 +46,8 @@ def denoise_with_dada2(sequences_path):
     print(f"  --p-trunc-len-r {TRUNC_LEN_R}")
     print(f"  --p-trim-left-f {TRIM_LEFT_F}")
     print(f"  --p-trim-left-r {TRIM_LEFT_R}")
+    print(f"  --p-chimera-method {CHIMERA_METHOD}")
+    print(f"  --p-n-threads {N_THREADS}")
     print(f"\nRunning DADA2...\n")
     
     # Run DADA2
@@ -53,6 +57,8 @@ def denoise_with_dada2(sequences_path):
         trunc_len_r=TRUNC_LEN_R,
         trim_left_f=TRIM_LEFT_F,
         trim_left_r=TRIM_LEFT_R,
+        chimera_method=CHIMERA_METHOD,
+        n_threads=N_THREADS,
     )
     
     # Save outputs
@@ -12,6 +12,7 @@ Task 4.3: FeatureTable and FeatureData summaries
 import os
 from qiime2 import Artifact, Metadata
 from qiime2.plugins import feature_table
+from _artifact_cache import run_parallel
 
 # Define paths
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -48,6 +49,12 @@ def create_summaries(table_path, sequences_path, metadata_path, prefix, approach
     sequences = Artifact.load(sequences_path)
     metadata = Metadata.load(metadata_path)
     
+    return summarize(table, sequences, metadata, prefix, approach_name)
+
+
+def summarize(table, sequences, metadata, prefix, approach_name):
+    """Create visual summaries of already-loaded table and sequence artifacts."""
+    
     print(f"\nGenerating feature-table summaries...")
     
     # 1. Feature table summary
@@ -85,41 +92,28 @@ def main():
     print(f"\nOutput directory: {OUTPUT_DIR}")
     print("="*60 + "\n")
     
-    metadata = Metadata.load(METADATA_FILE)
     all_outputs = []
+    jobs = []
     
-    # Generate DADA2 summaries
+    # DADA2 summaries
     if os.path.exists(DADA2_TABLE) and os.path.exists(DADA2_SEQS):
-        print("\n" + "─"*60)
-        print("Processing DADA2 outputs (ASVs)...")
-        print("─"*60)
-        dada2_outputs = create_summaries(
-            DADA2_TABLE, 
-            DADA2_SEQS, 
-            METADATA_FILE,
-            'dada2-asv',
-            'DADA2 (ASVs)'
-        )
-        all_outputs.extend(dada2_outputs)
+        jobs.append((DADA2_TABLE, DADA2_SEQS, METADATA_FILE, 'dada2-asv', 'DADA2 (ASVs)'))
     else:
         print(f"\n⚠️  DADA2 outputs not found, skipping...")
     
-    # Generate vsearch summaries
+    # vsearch summaries
     if os.path.exists(VSEARCH_TABLE) and os.path.exists(VSEARCH_SEQS):
-        print("\n" + "─"*60)
-        print("Processing vsearch outputs (OTUs)...")
-        print("─"*60)
-        vsearch_outputs = create_summaries(
-            VSEARCH_TABLE,
-            VSEARCH_SEQS,
-            METADATA_FILE,
-            'vsearch-otu',
-            'vsearch (OTUs)'
-        )
-        all_outputs.extend(vsearch_outputs)
+        jobs.append((VSEARCH_TABLE, VSEARCH_SEQS, METADATA_FILE, 'vsearch-otu', 'vsearch (OTUs)'))
     else:
         print(f"\n⚠️  vsearch outputs not found, skipping...")
     
+    # The approaches are independent: summarize them in parallel processes.
+    # Each worker loads its own inputs and saves its .qzv files itself.
+    if jobs:
+        print(f"\nProcessing {len(jobs)} approach(es) in parallel...")
+        for outputs in run_parallel(create_summaries, jobs):
+            all_outputs.extend(outputs)
+    
     # Final summary
     print("\n" + "="*60)
     print("✓ TASK 4.3 COMPLETE: Feature Table Summaries")
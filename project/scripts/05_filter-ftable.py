@@ -10,8 +10,7 @@ Task 5: Filtering features from the feature table
 """
 
 import os
-from qiime2 import Artifact, Metadata
-from qiime2.plugins import feature_table
+from _artifact_cache import load as load_artifact, load_metadata, run_parallel, save_all
 
 # Define paths
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -36,9 +35,13 @@ os.makedirs(OUTPUT_DIR, exist_ok=True)
 # Filtering parameters
 MIN_SAMPLES = 2  # Minimum number of samples a feature must be present in
 
+# Set SKIP_QZV=1 to skip the .qzv summaries in batch runs
+SKIP_VIZ = os.environ.get('SKIP_QZV') == '1'
 
-def filter_features(table_path, seqs_path, output_dir, prefix, approach_name):
+
+def filter_features(table_path, seqs_path, output_dir, prefix, approach_name, metadata):
     """Filter features present in fewer than min_samples samples."""
+    from qiime2.plugins import feature_table
     
     print("="*60)
     print(f"FILTERING FEATURES: {approach_name}")
@@ -48,8 +51,8 @@ def filter_features(table_path, seqs_path, output_dir, prefix, approach_name):
     print(f"  Table: {table_path}")
     print(f"  Sequences: {seqs_path}")
     
-    table = Artifact.load(table_path)
-    sequences = Artifact.load(seqs_path)
+    table = load_artifact(table_path)
+    sequences = load_artifact(seqs_path)
     
     print(f"\nFiltering parameters:")
     print(f"  --min-samples {MIN_SAMPLES}")
@@ -62,9 +65,11 @@ def filter_features(table_path, seqs_path, output_dir, prefix, approach_name):
         min_samples=MIN_SAMPLES
     )
     
+    # Outputs are collected here and written together at the end
+    pending = []
+    
     filtered_table_path = os.path.join(output_dir, f'{prefix}-table-ms{MIN_SAMPLES}.qza')
-    filtered_table_result.filtered_table.save(filtered_table_path)
-    print(f"   ✓ Saved: {filtered_table_path}")
+    pending.append((filtered_table_result.filtered_table, filtered_table_path))
     
     # Step 2: Filter sequences to match filtered table
     print(f"\n2. Filtering sequences to match filtered table...")
@@ -74,33 +79,38 @@ def filter_features(table_path, seqs_path, output_dir, prefix, approach_name):
     )
     
     filtered_seqs_path = os.path.join(output_dir, f'{prefix}-rep-seqs-ms{MIN_SAMPLES}.qza')
-    filtered_seqs_result.filtered_data.save(filtered_seqs_path)
-    print(f"   ✓ Saved: {filtered_seqs_path}")
+    pending.append((filtered_seqs_result.filtered_data, filtered_seqs_path))
     
-    # Generate summary visualizations
-    print(f"\n3. Generating summary visualizations...")
-    metadata = Metadata.load(METADATA_FILE)
-    
-    # Table summary
-    table_viz = feature_table.visualizers.summarize(
-        table=filtered_table_result.filtered_table,
-        sample_metadata=metadata
-    )
-    table_viz_path = os.path.join(output_dir, f'{prefix}-table-ms{MIN_SAMPLES}.qzv')
-    table_viz.visualization.save(table_viz_path)
-    print(f"   ✓ Table summary: {table_viz_path}")
+    if SKIP_VIZ:
+        print(f"\n3. Skipping summary visualizations (SKIP_QZV=1)")
+    else:
+        # Generate summary visualizations
+        print(f"\n3. Generating summary visualizations...")
+        
+        # Table summary
+        table_viz = feature_table.visualizers.summarize(
+            table=filtered_table_result.filtered_table,
+            sample_metadata=metadata
+        )
+        table_viz_path = os.path.join(output_dir, f'{prefix}-table-ms{MIN_SAMPLES}.qzv')
+        pending.append((table_viz.visualization, table_viz_path))
+        
+        # Sequences summary
+        seqs_viz = feature_table.visualizers.tabulate_seqs(
+            data=filtered_seqs_result.filtered_data
+        )
+        seqs_viz_path = os.path.join(output_dir, f'{prefix}-rep-seqs-ms{MIN_SAMPLES}.qzv')
+        pending.append((seqs_viz.visualization, seqs_viz_path))
     
-    # Sequences summary
-    seqs_viz = feature_table.visualizers.tabulate_seqs(
-        data=filtered_seqs_result.filtered_data
-    )
-    seqs_viz_path = os.path.join(output_dir, f'{prefix}-rep-seqs-ms{MIN_SAMPLES}.qzv')
-    seqs_viz.visualization.save(seqs_viz_path)
-    print(f"   ✓ Sequences summary: {seqs_viz_path}")
+    # Write all outputs together
+    print(f"\nSaving {len(pending)} files...")
+    save_all(pending)
+    for _, path in pending:
+        print(f"   ✓ Saved: {path}")
     
     print(f"\n✓ {approach_name} FILTERING COMPLETE")
     
-    return filtered_table_path, filtered_seqs_path, table_viz_path, seqs_viz_path
+    return tuple(path for _, path in pending)
 
 
 def main():
@@ -114,41 +124,29 @@ def main():
     print("="*60 + "\n")
     
     all_outputs = []
+    jobs = []
     
     # Filter DADA2 features
     if os.path.exists(DADA2_TABLE) and os.path.exists(DADA2_SEQS):
-        print("\n" + "─"*60)
-        print("Processing DADA2 outputs (ASVs)...")
-        print("─"*60)
-        
-        dada2_outputs = filter_features(
-            DADA2_TABLE,
-            DADA2_SEQS,
-            OUTPUT_DIR,
-            'dada2-asv',
-            'DADA2 (ASVs)'
-        )
-        all_outputs.extend(dada2_outputs)
+        jobs.append((DADA2_TABLE, DADA2_SEQS, OUTPUT_DIR, 'dada2-asv', 'DADA2 (ASVs)'))
     else:
         print(f"\n⚠️  DADA2 outputs not found, skipping...")
     
     # Filter vsearch features
     if os.path.exists(VSEARCH_TABLE) and os.path.exists(VSEARCH_SEQS):
-        print("\n" + "─"*60)
-        print("Processing vsearch outputs (OTUs)...")
-        print("─"*60)
-        
-        vsearch_outputs = filter_features(
-            VSEARCH_TABLE,
-            VSEARCH_SEQS,
-            OUTPUT_DIR,
-            'vsearch-otu',
-            'vsearch (OTUs)'
-        )
-        all_outputs.extend(vsearch_outputs)
+        jobs.append((VSEARCH_TABLE, VSEARCH_SEQS, OUTPUT_DIR, 'vsearch-otu', 'vsearch (OTUs)'))
     else:
         print(f"\n⚠️  vsearch outputs not found, skipping...")
     
+    # The approaches share no data: filter them in parallel processes.
+    if jobs:
+        # Load the sample metadata once for both approaches
+        metadata = load_metadata(METADATA_FILE)
+        
+        print(f"\nProcessing {len(jobs)} approach(es) in parallel...")
+        for outputs in run_parallel(filter_features, [(*job, metadata) for job in jobs]):
+            all_outputs.extend(outputs)
+    
     # Final summary
     print("\n" + "="*60)
     print("✓ TASK 5 COMPLETE: Feature Filtering")
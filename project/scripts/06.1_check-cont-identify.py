@@ -10,8 +10,7 @@ Task 6: Checking for contamination
 """
 
 import os
-from qiime2 import Artifact, Metadata
-from qiime2.plugins import quality_control
+from _artifact_cache import load as load_artifact, load_metadata
 
 # Define paths
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -37,8 +36,9 @@ PREV_CONTROL_COLUMN = 'sample-type'
 PREV_CONTROL_INDICATOR = 'Negative-Control'
 
 
-def identify_contaminants(table_path, output_dir, prefix, approach_name):
+def identify_contaminants(table_path, output_dir, prefix, approach_name, metadata):
     """Identify contaminant features using decontam."""
+    from qiime2.plugins import quality_control
     
     print("="*60)
     print(f"CONTAMINATION IDENTIFICATION: {approach_name}")
@@ -46,11 +46,9 @@ def identify_contaminants(table_path, output_dir, prefix, approach_name):
     
     print(f"\nLoading:")
     print(f"  Table: {table_path}")
-    print(f"  Metadata: {METADATA_FILE}")
     
     # Load inputs
-    table = Artifact.load(table_path)
-    metadata = Metadata.load(METADATA_FILE)
+    table = load_artifact(table_path)
     
     print(f"\nDecontam parameters:")
     print(f"  Method: {METHOD}")
@@ -84,9 +82,11 @@ def main():
     print("\n" + "="*60)
     print("TASK 6: CHECKING FOR CONTAMINATION")
     print("="*60)
-    print(f"\nOutput directory: {OUTPUT_DIR}")
+    print(f"\nMetadata: {METADATA_FILE}")
+    print(f"Output directory: {OUTPUT_DIR}")
     print("="*60 + "\n")
     
+    # The metadata is loaded on first use and cached for the second approach
     all_outputs = []
     
     # Process DADA2 features (ASVs)
@@ -99,7 +99,8 @@ def main():
             DADA2_TABLE,
             OUTPUT_DIR,
             'dada2-asv',
-            'DADA2 (ASVs)'
+            'DADA2 (ASVs)',
+            load_metadata(METADATA_FILE)
         )
         all_outputs.append(dada2_scores)
     else:
@@ -115,7 +116,8 @@ def main():
             VSEARCH_TABLE,
             OUTPUT_DIR,
             'vsearch-otu',
-            'vsearch (OTUs)'
+            'vsearch (OTUs)',
+            load_metadata(METADATA_FILE)
         )
         all_outputs.append(vsearch_scores)
     else:
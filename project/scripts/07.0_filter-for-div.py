@@ -11,8 +11,7 @@ Task 7.0: Filter for diversity analyses
 """
 
 import os
-from qiime2 import Artifact, Metadata
-from qiime2.plugins import feature_table
+from _artifact_cache import load as load_artifact, load_metadata, save_all
 
 # Define paths
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -29,12 +28,22 @@ OTU_SEQS = os.path.join(INPUT_DIR, 'vsearch-otu-rep-seqs-ms2.qza')
 # Create output directory
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-# Metadata query to exclude controls - note the quotes around column name
-EXCLUDE_CONTROLS_QUERY = "[sample-id] NOT IN ('PK', 'NK')"
+# Control samples to exclude (positive control, negative control)
+CONTROL_SAMPLE_IDS = ['PK', 'NK']
 
+# Metadata query to exclude controls - note the quotes around column name.
+# Like any where query, it also drops table samples missing from the metadata.
+EXCLUDE_CONTROLS_QUERY = "[sample-id] NOT IN ({})".format(
+    ', '.join(f"'{sample_id}'" for sample_id in CONTROL_SAMPLE_IDS)
+)
 
-def filter_controls(table_path, seqs_path, output_prefix, approach_name):
+# Set SKIP_QZV=1 to skip the .qzv summaries in batch runs
+SKIP_VIZ = os.environ.get('SKIP_QZV') == '1'
+
+
+def filter_controls(table_path, seqs_path, output_prefix, approach_name, metadata):
     """Filter out control samples, keeping only biological samples."""
+    from qiime2.plugins import feature_table
     
     print("="*60)
     print(f"FILTERING CONTROLS: {approach_name}")
@@ -44,9 +53,8 @@ def filter_controls(table_path, seqs_path, output_prefix, approach_name):
     print(f"  Table: {table_path}")
     print(f"  Sequences: {seqs_path}")
     
-    table = Artifact.load(table_path)
-    sequences = Artifact.load(seqs_path)
-    metadata = Metadata.load(METADATA_FILE)
+    table = load_artifact(table_path)
+    sequences = load_artifact(seqs_path)
     
     print(f"\nFiltering criteria:")
     print(f"  Exclude: PK (positive control), NK (negative control)")
@@ -61,9 +69,11 @@ def filter_controls(table_path, seqs_path, output_prefix, approach_name):
         where=EXCLUDE_CONTROLS_QUERY
     )
     
+    # Outputs are collected here and written together at the end
+    pending = []
+    
     bio_table_path = os.path.join(OUTPUT_DIR, f'{output_prefix}-table-bio.qza')
-    filtered_table_result.filtered_table.save(bio_table_path)
-    print(f"   ✓ Saved: {bio_table_path}")
+    pending.append((filtered_table_result.filtered_table, bio_table_path))
     
     # Step 2: Filter sequences to match biological-only table
     print(f"\n2. Filtering sequences to match biological samples...")
@@ -73,32 +83,38 @@ def filter_controls(table_path, seqs_path, output_prefix, approach_name):
     )
     
     bio_seqs_path = os.path.join(OUTPUT_DIR, f'{output_prefix}-rep-seqs-bio.qza')
-    filtered_seqs_result.filtered_data.save(bio_seqs_path)
-    print(f"   ✓ Saved: {bio_seqs_path}")
+    pending.append((filtered_seqs_result.filtered_data, bio_seqs_path))
     
-    # Step 3: Generate summary visualizations
-    print(f"\n3. Generating summary visualizations...")
-    
-    # Table summary
-    table_viz = feature_table.visualizers.summarize(
-        table=filtered_table_result.filtered_table,
-        sample_metadata=metadata
-    )
-    table_viz_path = os.path.join(OUTPUT_DIR, f'{output_prefix}-table-bio.qzv')
-    table_viz.visualization.save(table_viz_path)
-    print(f"   ✓ Table summary: {table_viz_path}")
+    if SKIP_VIZ:
+        print(f"\n3. Skipping summary visualizations (SKIP_QZV=1)")
+    else:
+        # Step 3: Generate summary visualizations
+        print(f"\n3. Generating summary visualizations...")
+        
+        # Table summary
+        table_viz = feature_table.visualizers.summarize(
+            table=filtered_table_result.filtered_table,
+            sample_metadata=metadata
+        )
+        table_viz_path = os.path.join(OUTPUT_DIR, f'{output_prefix}-table-bio.qzv')
+        pending.append((table_viz.visualization, table_viz_path))
+        
+        # Sequences summary
+        seqs_viz = feature_table.visualizers.tabulate_seqs(
+            data=filtered_seqs_result.filtered_data
+        )
+        seqs_viz_path = os.path.join(OUTPUT_DIR, f'{output_prefix}-rep-seqs-bio.qzv')
+        pending.append((seqs_viz.visualization, seqs_viz_path))
     
-    # Sequences summary
-    seqs_viz = feature_table.visualizers.tabulate_seqs(
-        data=filtered_seqs_result.filtered_data
-    )
-    seqs_viz_path = os.path.join(OUTPUT_DIR, f'{output_prefix}-rep-seqs-bio.qzv')
-    seqs_viz.visualization.save(seqs_viz_path)
-    print(f"   ✓ Sequences summary: {seqs_viz_path}")
+    # Write all outputs together
+    print(f"\nSaving {len(pending)} files...")
+    save_all(pending)
+    for _, path in pending:
+        print(f"   ✓ Saved: {path}")
     
     print(f"\n✓ {approach_name} CONTROL FILTERING COMPLETE")
     
-    return bio_table_path, bio_seqs_path, table_viz_path, seqs_viz_path
+    return tuple(path for _, path in pending)
 
 
 def main():
@@ -112,6 +128,7 @@ def main():
     print(f"Output directory: {OUTPUT_DIR}")
     print("="*60 + "\n")
     
+    # The metadata is loaded on first use and cached for the second approach
     all_outputs = []
     
     # Filter ASV data
@@ -124,7 +141,8 @@ def main():
             ASV_TABLE,
             ASV_SEQS,
             'asv',
-            'ASV (DADA2)'
+            'ASV (DADA2)',
+            load_metadata(METADATA_FILE)
         )
         all_outputs.extend(asv_outputs)
     else:
@@ -140,7 +158,8 @@ def main():
             OTU_TABLE,
             OTU_SEQS,
             'otu',
-            'OTU (vsearch)'
+            'OTU (vsearch)',
+            load_metadata(METADATA_FILE)
         )
         all_outputs.extend(otu_outputs)
     else:
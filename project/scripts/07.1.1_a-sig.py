@@ -11,8 +11,7 @@ Task 7.1.1: Alpha diversity group significance testing
 """
 
 import os
-from qiime2 import Artifact, Metadata
-from qiime2.plugins import diversity
+from _artifact_cache import load as load_artifact, load_metadata, run_parallel
 
 # Define paths
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -24,8 +23,31 @@ METADATA_FILE = os.path.join(BASE_DIR, 'data', 'processed', 'sample-metadata.tsv
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
 
-def test_alpha_significance(diversity_subdir, output_prefix, approach_name):
-    """Test alpha diversity metrics for group significance."""
+# Alpha diversity vectors to test: (label, vector file, output prefix)
+ALPHA_METRICS = [
+    ('Faith PD', 'faith-pd-vector.qza', 'faith-pd'),
+    ('Evenness', 'evenness-vector.qza', 'evenness'),
+]
+
+
+def test_metric(vector_path, metadata, output_path):
+    """Run alpha_group_significance for one vector and save the visualization."""
+    from qiime2.plugins import diversity
+    
+    # Load the vector inside the worker instead of pickling it
+    alpha_vector = load_artifact(vector_path)
+    
+    viz = diversity.visualizers.alpha_group_significance(
+        alpha_diversity=alpha_vector,
+        metadata=metadata
+    )
+    viz.visualization.save(output_path)
+    
+    return output_path
+
+
+def alpha_significance_jobs(diversity_subdir, output_prefix, approach_name, metadata):
+    """Return the output directory and one test_metric job per alpha metric."""
     
     print("="*60)
     print(f"ALPHA DIVERSITY SIGNIFICANCE: {approach_name}")
@@ -33,12 +55,6 @@ def test_alpha_significance(diversity_subdir, output_prefix, approach_name):
     
     diversity_path = os.path.join(DIVERSITY_DIR, diversity_subdir)
     
-    # Load alpha diversity vectors
-    faith_pd = Artifact.load(os.path.join(diversity_path, 'faith-pd-vector.qza'))
-    evenness = Artifact.load(os.path.join(diversity_path, 'evenness-vector.qza'))
-    
-    metadata = Metadata.load(METADATA_FILE)
-    
     print(f"\nTesting alpha diversity metrics:")
     print(f"  - Faith PD (phylogenetic diversity)")
     print(f"  - Evenness (distribution)")
@@ -49,29 +65,14 @@ def test_alpha_significance(diversity_subdir, output_prefix, approach_name):
     output_subdir = os.path.join(OUTPUT_DIR, output_prefix)
     os.makedirs(output_subdir, exist_ok=True)
     
-    # Test Faith PD
-    print(f"\n1. Testing Faith PD...")
-    faith_pd_viz = diversity.visualizers.alpha_group_significance(
-        alpha_diversity=faith_pd,
-        metadata=metadata
-    )
-    faith_pd_path = os.path.join(output_subdir, 'faith-pd-group-significance.qzv')
-    faith_pd_viz.visualization.save(faith_pd_path)
-    print(f"   ✓ Saved: faith-pd-group-significance.qzv")
-    
-    # Test Evenness
-    print(f"\n4. Testing Evenness...")
-    evenness_viz = diversity.visualizers.alpha_group_significance(
-        alpha_diversity=evenness,
-        metadata=metadata
-    )
-    evenness_path = os.path.join(output_subdir, 'evenness-group-significance.qzv')
-    evenness_viz.visualization.save(evenness_path)
-    print(f"   ✓ Saved: evenness-group-significance.qzv")
-    
-    print(f"\n✓ {approach_name} ALPHA SIGNIFICANCE TESTING COMPLETE")
+    jobs = [
+        (os.path.join(diversity_path, vector_file),
+         metadata,
+         os.path.join(output_subdir, f'{metric_prefix}-group-significance.qzv'))
+        for _, vector_file, metric_prefix in ALPHA_METRICS
+    ]
     
-    return output_subdir
+    return output_subdir, jobs
 
 
 def main():
@@ -85,7 +86,10 @@ def main():
     print(f"Output directory: {OUTPUT_DIR}")
     print("="*60 + "\n")
     
+    # The metadata is loaded on first use and cached for the second approach
     completed_tests = []
+    jobs = []
+    job_labels = []
     
     # Test ASV alpha diversity
     asv_diversity_dir = os.path.join(DIVERSITY_DIR, 'asv-core-metrics')
@@ -94,12 +98,15 @@ def main():
         print("Processing ASV data...")
         print("─"*60)
         
-        asv_output = test_alpha_significance(
+        asv_output, asv_jobs = alpha_significance_jobs(
             'asv-core-metrics',
             'asv',
-            'ASV (DADA2)'
+            'ASV (DADA2)',
+            load_metadata(METADATA_FILE)
         )
         completed_tests.append(('ASV', asv_output))
+        jobs.extend(asv_jobs)
+        job_labels.extend(f"ASV {label}" for label, _, _ in ALPHA_METRICS)
     else:
         print(f"\n⚠️  ASV diversity data not found, skipping...")
     
@@ -110,15 +117,24 @@ def main():
         print("Processing OTU data...")
         print("─"*60)
         
-        otu_output = test_alpha_significance(
+        otu_output, otu_jobs = alpha_significance_jobs(
             'otu-core-metrics',
             'otu',
-            'OTU (vsearch)'
+            'OTU (vsearch)',
+            load_metadata(METADATA_FILE)
         )
         completed_tests.append(('OTU', otu_output))
+        jobs.extend(otu_jobs)
+        job_labels.extend(f"OTU {label}" for label, _, _ in ALPHA_METRICS)
     else:
         print(f"\n⚠️  OTU diversity data not found, skipping...")
     
+    # Every approach x metric test is independent: run them all in one pool
+    if jobs:
+        print(f"\nTesting {len(jobs)} metric(s) in parallel...")
+        for label, output_path in zip(job_labels, run_parallel(test_metric, jobs)):
+            print(f"   ✓ {label}: {os.path.basename(output_path)}")
+    
     # Final summary
     print("\n" + "="*60)
     print("✓ TASK 7.1.1 COMPLETE: Alpha Diversity Significance")
@@ -12,8 +12,7 @@ Task 7.1.2: Beta diversity group significance testing
 """
 
 import os
-from qiime2 import Artifact, Metadata
-from qiime2.plugins import diversity
+from _artifact_cache import load as load_artifact, load_metadata, run_parallel
 
 # Define paths
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -28,8 +27,41 @@ os.makedirs(OUTPUT_DIR, exist_ok=True)
 METADATA_COLUMNS = ['sample-type', 'disease-state', 'subject']
 
 
-def test_beta_significance(diversity_subdir, output_prefix, approach_name):
-    """Test beta diversity for group significance using PERMANOVA."""
+def test_column(dm_path, metadata_column, output_subdir):
+    """Run PERMANOVA for one metadata column and save the visualization."""
+    from qiime2.plugins import diversity
+    
+    # Load the distance matrix inside the worker instead of pickling it
+    unweighted_unifrac_dm = load_artifact(dm_path)
+    
+    unifrac_viz = diversity.visualizers.beta_group_significance(
+        distance_matrix=unweighted_unifrac_dm,
+        metadata=metadata_column,
+        pairwise=True
+    )
+    
+    unifrac_path = os.path.join(
+        output_subdir, 
+        f'unweighted-unifrac-{metadata_column.name}-significance.qzv'
+    )
+    unifrac_viz.visualization.save(unifrac_path)
+    
+    return unifrac_path
+
+
+def load_metadata_columns():
+    """Extract the tested columns (the metadata is parsed once per process)."""
+    metadata = load_metadata(METADATA_FILE)
+    return {column: metadata.get_column(column) for column in METADATA_COLUMNS}
+
+
+def beta_significance_jobs(diversity_subdir, output_prefix, approach_name, metadata_columns):
+    """
+    Return the output directory and one PERMANOVA (test_column) job per column.
+    
+    metadata_columns maps each name in METADATA_COLUMNS to its
+    MetadataColumn (see load_metadata_columns()).
+    """
     
     print("="*60)
     print(f"BETA DIVERSITY SIGNIFICANCE: {approach_name}")
@@ -37,12 +69,8 @@ def test_beta_significance(diversity_subdir, output_prefix, approach_name):
     
     diversity_path = os.path.join(DIVERSITY_DIR, diversity_subdir)
     
-    # Load unweighted UniFrac distance matrix
-    unweighted_unifrac_dm = Artifact.load(
-        os.path.join(diversity_path, 'unweighted-unifrac-distance-matrix.qza')
-    )
-    
-    metadata = Metadata.load(METADATA_FILE)
+    # Unweighted UniFrac distance matrix (loaded by the workers)
+    dm_path = os.path.join(diversity_path, 'unweighted-unifrac-distance-matrix.qza')
     
     print(f"\nTesting: Unweighted UniFrac distances")
     print(f"Metadata columns: {', '.join(METADATA_COLUMNS)}")
@@ -52,30 +80,9 @@ def test_beta_significance(diversity_subdir, output_prefix, approach_name):
     output_subdir = os.path.join(OUTPUT_DIR, output_prefix)
     os.makedirs(output_subdir, exist_ok=True)
     
-    # Test each metadata column
-    for column in METADATA_COLUMNS:
-        print(f"\nTesting: {column}")
-        
-        # Get metadata column
-        metadata_column = metadata.get_column(column)
-        
-        # Test Unweighted UniFrac
-        unifrac_viz = diversity.visualizers.beta_group_significance(
-            distance_matrix=unweighted_unifrac_dm,
-            metadata=metadata_column,
-            pairwise=True
-        )
-        
-        unifrac_path = os.path.join(
-            output_subdir, 
-            f'unweighted-unifrac-{column}-significance.qzv'
-        )
-        unifrac_viz.visualization.save(unifrac_path)
-        print(f"  ✓ Saved: unweighted-unifrac-{column}-significance.qzv")
-    
-    print(f"\n✓ {approach_name} BETA SIGNIFICANCE TESTING COMPLETE")
+    jobs = [(dm_path, metadata_columns[column], output_subdir) for column in METADATA_COLUMNS]
     
-    return output_subdir
+    return output_subdir, jobs
 
 
 def main():
@@ -90,6 +97,7 @@ def main():
     print("="*60 + "\n")
     
     completed_tests = []
+    jobs = []
     
     # Test ASV beta diversity
     asv_diversity_dir = os.path.join(DIVERSITY_DIR, 'asv-core-metrics')
@@ -98,12 +106,14 @@ def main():
         print("Processing ASV data...")
         print("─"*60)
         
-        asv_output = test_beta_significance(
+        asv_output, asv_jobs = beta_significance_jobs(
             'asv-core-metrics',
             'asv',
-            'ASV (DADA2)'
+            'ASV (DADA2)',
+            load_metadata_columns()
         )
         completed_tests.append(('ASV', asv_output))
+        jobs.extend(asv_jobs)
     else:
         print(f"\n⚠️  ASV diversity data not found, skipping...")
     
@@ -114,15 +124,23 @@ def main():
         print("Processing OTU data...")
         print("─"*60)
         
-        otu_output = test_beta_significance(
+        otu_output, otu_jobs = beta_significance_jobs(
             'otu-core-metrics',
             'otu',
-            'OTU (vsearch)'
+            'OTU (vsearch)',
+            load_metadata_columns()
         )
         completed_tests.append(('OTU', otu_output))
+        jobs.extend(otu_jobs)
     else:
         print(f"\n⚠️  OTU diversity data not found, skipping...")
     
+    # Every approach x column test is independent: run them all in one pool
+    if jobs:
+        print(f"\nTesting {len(jobs)} column(s) in parallel...")
+        for output_path in run_parallel(test_column, jobs):
+            print(f"  ✓ Saved: {os.path.relpath(output_path, OUTPUT_DIR)}")
+    
     # Final summary
     print("\n" + "="*60)
     print("✓ TASK 7.1.2 COMPLETE: Beta Diversity Significance")
@@ -7,13 +7,12 @@ Task 7.1: Alpha and beta diversity analysis
 - Rarefies feature tables to even sampling depth
 - Computes alpha diversity metrics (Shannon, Faith PD, Observed Features, Evenness)
 - Computes beta diversity metrics (Jaccard, Bray-Curtis, Unweighted UniFrac, Weighted UniFrac)
-- Generates PCoA plots with Emperor
+- Generates PCoA plots with Emperor (optional, GENERATE_EMPEROR=1)
 - Processes both ASV and OTU datasets
 """
 
 import os
-from qiime2 import Artifact, Metadata
-from qiime2.plugins import diversity
+from _artifact_cache import load as load_artifact, load_metadata, run_parallel, save_all
 
 # Define paths
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -33,11 +32,38 @@ os.makedirs(OUTPUT_DIR, exist_ok=True)
 
 # Diversity analysis parameters
 SAMPLING_DEPTH = 2700
-N_JOBS = 'auto'
+# Jobs/threads for one approach; main() splits the cores between the
+# approaches it runs side by side
+N_JOBS = os.cpu_count() or 1
 
+# Emperor plots are large and rarely opened: only generate them with
+# GENERATE_EMPEROR=1 (or later from the saved PCoA via regenerate_emperor())
+GENERATE_EMPEROR = os.environ.get('GENERATE_EMPEROR', '0') == '1'
 
-def run_core_metrics(table_path, tree_path, output_subdir, approach_name):
-    """Run core-metrics-phylogenetic pipeline for diversity analysis."""
+# Output names: (file stem, label)
+ALPHA_METRICS = [
+    ('faith-pd', 'Faith PD'),
+    ('observed-features', 'Observed features'),
+    ('shannon', 'Shannon'),
+    ('evenness', 'Evenness'),
+]
+BETA_METRICS = [
+    ('jaccard', 'Jaccard'),
+    ('bray-curtis', 'Bray-Curtis'),
+    ('unweighted-unifrac', 'Unweighted UniFrac'),
+    ('weighted-unifrac', 'Weighted UniFrac'),
+]
+
+
+def run_core_metrics(table_path, tree_path, output_subdir, approach_name, metadata, n_jobs=N_JOBS):
+    """
+    Compute the core-metrics-phylogenetic outputs for diversity analysis.
+    
+    Calls the diversity-lib actions directly on one rarefied table instead
+    of going through the core_metrics_phylogenetic pipeline; the outputs
+    are the same as the pipeline's.
+    """
+    from qiime2.plugins import diversity, diversity_lib, emperor, feature_table
     
     print("="*60)
     print(f"DIVERSITY ANALYSIS: {approach_name}")
@@ -46,17 +72,15 @@ def run_core_metrics(table_path, tree_path, output_subdir, approach_name):
     print(f"\nLoading:")
     print(f"  Table: {table_path}")
     print(f"  Tree: {tree_path}")
-    print(f"  Metadata: {METADATA_FILE}")
     
-    table = Artifact.load(table_path)
-    tree = Artifact.load(tree_path)
-    metadata = Metadata.load(METADATA_FILE)
+    table = load_artifact(table_path)
+    tree = load_artifact(tree_path)
     
     print(f"\nParameters:")
     print(f"  --p-sampling-depth {SAMPLING_DEPTH}")
-    print(f"  --p-n-jobs-or-threads '{N_JOBS}'")
+    print(f"  --p-n-jobs-or-threads {n_jobs}")
     
-    print(f"\nRunning core-metrics-phylogenetic...")
+    print(f"\nRunning core metrics (phylogenetic)...")
     print(f"This will compute:")
     print(f"  Alpha diversity: Shannon, Observed Features, Faith PD, Evenness")
     print(f"  Beta diversity: Jaccard, Bray-Curtis, Unweighted UniFrac, Weighted UniFrac")
@@ -66,94 +90,98 @@ def run_core_metrics(table_path, tree_path, output_subdir, approach_name):
     diversity_output_dir = os.path.join(OUTPUT_DIR, output_subdir)
     os.makedirs(diversity_output_dir, exist_ok=True)
     
-    # Run core-metrics-phylogenetic pipeline
-    diversity_results = diversity.pipelines.core_metrics_phylogenetic(
+    # Rarefy once; every metric below uses the same rarefied table
+    rarefied_table = feature_table.methods.rarefy(
         table=table,
-        phylogeny=tree,
-        sampling_depth=SAMPLING_DEPTH,
-        metadata=metadata,
-        n_jobs_or_threads=N_JOBS
-    )
-    
-    # Save all outputs
-    print(f"\nSaving outputs to: {diversity_output_dir}/")
-    
-    # Rarefied table
-    rarefied_table_path = os.path.join(diversity_output_dir, 'rarefied-table.qza')
-    diversity_results.rarefied_table.save(rarefied_table_path)
-    print(f"  ✓ Rarefied table: rarefied-table.qza")
+        sampling_depth=SAMPLING_DEPTH
+    ).rarefied_table
     
     # Alpha diversity vectors
-    faith_pd_path = os.path.join(diversity_output_dir, 'faith-pd-vector.qza')
-    diversity_results.faith_pd_vector.save(faith_pd_path)
-    print(f"  ✓ Faith PD: faith-pd-vector.qza")
-    
-    observed_features_path = os.path.join(diversity_output_dir, 'observed-features-vector.qza')
-    diversity_results.observed_features_vector.save(observed_features_path)
-    print(f"  ✓ Observed features: observed-features-vector.qza")
-    
-    shannon_path = os.path.join(diversity_output_dir, 'shannon-vector.qza')
-    diversity_results.shannon_vector.save(shannon_path)
-    print(f"  ✓ Shannon: shannon-vector.qza")
-    
-    evenness_path = os.path.join(diversity_output_dir, 'evenness-vector.qza')
-    diversity_results.evenness_vector.save(evenness_path)
-    print(f"  ✓ Evenness: evenness-vector.qza")
+    alpha_vectors = {
+        'faith-pd': diversity_lib.methods.faith_pd(
+            table=rarefied_table, phylogeny=tree, threads=n_jobs
+        ).vector,
+        'observed-features': diversity_lib.methods.observed_features(
+            table=rarefied_table
+        ).vector,
+        'shannon': diversity_lib.methods.shannon_entropy(
+            table=rarefied_table
+        ).vector,
+        'evenness': diversity_lib.methods.pielou_evenness(
+            table=rarefied_table
+        ).vector,
+    }
     
     # Beta diversity distance matrices
-    jaccard_dm_path = os.path.join(diversity_output_dir, 'jaccard-distance-matrix.qza')
-    diversity_results.jaccard_distance_matrix.save(jaccard_dm_path)
-    print(f"  ✓ Jaccard distance matrix: jaccard-distance-matrix.qza")
-    
-    bray_curtis_dm_path = os.path.join(diversity_output_dir, 'bray-curtis-distance-matrix.qza')
-    diversity_results.bray_curtis_distance_matrix.save(bray_curtis_dm_path)
-    print(f"  ✓ Bray-Curtis distance matrix: bray-curtis-distance-matrix.qza")
-    
-    unweighted_unifrac_dm_path = os.path.join(diversity_output_dir, 'unweighted-unifrac-distance-matrix.qza')
-    diversity_results.unweighted_unifrac_distance_matrix.save(unweighted_unifrac_dm_path)
-    print(f"  ✓ Unweighted UniFrac distance matrix: unweighted-unifrac-distance-matrix.qza")
-    
-    weighted_unifrac_dm_path = os.path.join(diversity_output_dir, 'weighted-unifrac-distance-matrix.qza')
-    diversity_results.weighted_unifrac_distance_matrix.save(weighted_unifrac_dm_path)
-    print(f"  ✓ Weighted UniFrac distance matrix: weighted-unifrac-distance-matrix.qza")
+    distance_matrices = {
+        'jaccard': diversity_lib.methods.jaccard(
+            table=rarefied_table, n_jobs=n_jobs
+        ).distance_matrix,
+        'bray-curtis': diversity_lib.methods.bray_curtis(
+            table=rarefied_table, n_jobs=n_jobs
+        ).distance_matrix,
+        'unweighted-unifrac': diversity_lib.methods.unweighted_unifrac(
+            table=rarefied_table, phylogeny=tree, threads=n_jobs
+        ).distance_matrix,
+        'weighted-unifrac': diversity_lib.methods.weighted_unifrac(
+            table=rarefied_table, phylogeny=tree, threads=n_jobs
+        ).distance_matrix,
+    }
     
     # PCoA results
-    jaccard_pcoa_path = os.path.join(diversity_output_dir, 'jaccard-pcoa-results.qza')
-    diversity_results.jaccard_pcoa_results.save(jaccard_pcoa_path)
-    print(f"  ✓ Jaccard PCoA: jaccard-pcoa-results.qza")
+    pcoa_results = {
+        name: diversity.methods.pcoa(distance_matrix=dm).pcoa
+        for name, dm in distance_matrices.items()
+    }
     
-    bray_curtis_pcoa_path = os.path.join(diversity_output_dir, 'bray-curtis-pcoa-results.qza')
-    diversity_results.bray_curtis_pcoa_results.save(bray_curtis_pcoa_path)
-    print(f"  ✓ Bray-Curtis PCoA: bray-curtis-pcoa-results.qza")
+    # Save all outputs
+    print(f"\nSaving outputs to: {diversity_output_dir}/")
     
-    unweighted_unifrac_pcoa_path = os.path.join(diversity_output_dir, 'unweighted-unifrac-pcoa-results.qza')
-    diversity_results.unweighted_unifrac_pcoa_results.save(unweighted_unifrac_pcoa_path)
-    print(f"  ✓ Unweighted UniFrac PCoA: unweighted-unifrac-pcoa-results.qza")
+    outputs = [(rarefied_table, 'rarefied-table.qza', 'Rarefied table')]
+    outputs += [(alpha_vectors[name], f'{name}-vector.qza', label)
+                for name, label in ALPHA_METRICS]
+    outputs += [(distance_matrices[name], f'{name}-distance-matrix.qza', f'{label} distance matrix')
+                for name, label in BETA_METRICS]
+    outputs += [(pcoa_results[name], f'{name}-pcoa-results.qza', f'{label} PCoA')
+                for name, label in BETA_METRICS]
+    if GENERATE_EMPEROR:
+        outputs += [(emperor.visualizers.plot(pcoa=pcoa_results[name], metadata=metadata).visualization,
+                     f'{name}-emperor.qzv', f'{label} Emperor plot')
+                    for name, label in BETA_METRICS]
+    else:
+        print(f"  (Emperor plots skipped; set GENERATE_EMPEROR=1 to create them)")
     
-    weighted_unifrac_pcoa_path = os.path.join(diversity_output_dir, 'weighted-unifrac-pcoa-results.qza')
-    diversity_results.weighted_unifrac_pcoa_results.save(weighted_unifrac_pcoa_path)
-    print(f"  ✓ Weighted UniFrac PCoA: weighted-unifrac-pcoa-results.qza")
+    # Write all outputs concurrently (zipping releases the GIL)
+    save_all(
+        [(result, os.path.join(diversity_output_dir, filename)) for result, filename, _ in outputs],
+        max_workers=8
+    )
+    for _, filename, label in outputs:
+        print(f"  ✓ {label}: {filename}")
     
-    # Emperor visualizations
-    jaccard_emperor_path = os.path.join(diversity_output_dir, 'jaccard-emperor.qzv')
-    diversity_results.jaccard_emperor.save(jaccard_emperor_path)
-    print(f"  ✓ Jaccard Emperor plot: jaccard-emperor.qzv")
+    print(f"\n✓ {approach_name} DIVERSITY ANALYSIS COMPLETE")
     
-    bray_curtis_emperor_path = os.path.join(diversity_output_dir, 'bray-curtis-emperor.qzv')
-    diversity_results.bray_curtis_emperor.save(bray_curtis_emperor_path)
-    print(f"  ✓ Bray-Curtis Emperor plot: bray-curtis-emperor.qzv")
+    return diversity_output_dir
+
+
+def regenerate_emperor(pcoa_path, metadata_path=METADATA_FILE):
+    """
+    Create the Emperor plot for a saved PCoA result on demand.
     
-    unweighted_unifrac_emperor_path = os.path.join(diversity_output_dir, 'unweighted-unifrac-emperor.qzv')
-    diversity_results.unweighted_unifrac_emperor.save(unweighted_unifrac_emperor_path)
-    print(f"  ✓ Unweighted UniFrac Emperor plot: unweighted-unifrac-emperor.qzv")
+    The .qzv is written next to the PCoA file, e.g.
+    asv-core-metrics/jaccard-pcoa-results.qza -> jaccard-emperor.qzv
+    """
+    from qiime2.plugins import emperor
     
-    weighted_unifrac_emperor_path = os.path.join(diversity_output_dir, 'weighted-unifrac-emperor.qzv')
-    diversity_results.weighted_unifrac_emperor.save(weighted_unifrac_emperor_path)
-    print(f"  ✓ Weighted UniFrac Emperor plot: weighted-unifrac-emperor.qzv")
+    pcoa = load_artifact(pcoa_path)
+    metadata = load_metadata(metadata_path)
     
-    print(f"\n✓ {approach_name} DIVERSITY ANALYSIS COMPLETE")
+    emperor_viz = emperor.visualizers.plot(pcoa=pcoa, metadata=metadata)
+    emperor_path = pcoa_path.replace('-pcoa-results.qza', '-emperor.qzv')
+    emperor_viz.visualization.save(emperor_path)
+    print(f"  ✓ Emperor plot: {emperor_path}")
     
-    return diversity_output_dir
+    return emperor_path
 
 
 def main():
@@ -164,43 +192,36 @@ def main():
     print("="*60)
     print(f"\nSampling depth: {SAMPLING_DEPTH} sequences per sample")
     print(f"Note: Samples with fewer sequences will be excluded")
+    print(f"Metadata: {METADATA_FILE}")
     print(f"Output directory: {OUTPUT_DIR}")
     print("="*60 + "\n")
     
     completed_analyses = []
+    jobs = []
     
-    # Run ASV diversity analysis
+    # ASV diversity analysis
     if os.path.exists(ASV_TABLE) and os.path.exists(ASV_TREE):
-        print("\n" + "─"*60)
-        print("Processing ASV data...")
-        print("─"*60)
-        
-        asv_dir = run_core_metrics(
-            ASV_TABLE,
-            ASV_TREE,
-            'asv-core-metrics',
-            'ASV (DADA2)'
-        )
-        completed_analyses.append(('ASV', asv_dir))
+        jobs.append(('ASV', (ASV_TABLE, ASV_TREE, 'asv-core-metrics', 'ASV (DADA2)')))
     else:
         print(f"\n⚠️  ASV data not found, skipping...")
     
-    # Run OTU diversity analysis
+    # OTU diversity analysis
     if os.path.exists(OTU_TABLE) and os.path.exists(OTU_TREE):
-        print("\n" + "─"*60)
-        print("Processing OTU data...")
-        print("─"*60)
-        
-        otu_dir = run_core_metrics(
-            OTU_TABLE,
-            OTU_TREE,
-            'otu-core-metrics',
-            'OTU (vsearch)'
-        )
-        completed_analyses.append(('OTU', otu_dir))
+        jobs.append(('OTU', (OTU_TABLE, OTU_TREE, 'otu-core-metrics', 'OTU (vsearch)')))
     else:
         print(f"\n⚠️  OTU data not found, skipping...")
     
+    # The approaches are independent: run them in parallel processes.
+    if jobs:
+        # Load the sample metadata once for both approaches
+        metadata = load_metadata(METADATA_FILE)
+        
+        print(f"\nProcessing {len(jobs)} approach(es) in parallel...")
+        n_jobs = max(1, N_JOBS // len(jobs))
+        output_dirs = run_parallel(run_core_metrics,
+                                   [(*args, metadata, n_jobs) for _, args in jobs])
+        completed_analyses.extend(zip([approach for approach, _ in jobs], output_dirs))
+    
     # Final summary
     print("\n" + "="*60)
     print("✓ TASK 7.1 COMPLETE: Diversity Analysis")
@@ -214,7 +235,8 @@ def main():
             print(f"  - 4 alpha diversity vectors")
             print(f"  - 4 beta diversity distance matrices")
             print(f"  - 4 PCoA results")
-            print(f"  - 4 Emperor visualizations (.qzv)")
+            if GENERATE_EMPEROR:
+                print(f"  - 4 Emperor visualizations (.qzv)")
     print("="*60)
 
 
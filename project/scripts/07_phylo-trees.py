@@ -12,14 +12,22 @@ Task 7.1: Generate a tree for phylogenetic diversity analyses
 """
 
 import os
-from qiime2 import Artifact
+import hashlib
+import shutil
+import tempfile
+import zipfile
+import qiime2
 from qiime2.plugins import phylogeny
+from _artifact_cache import FORCE_REBUILD, is_up_to_date, load as load_artifact, run_parallel, save_all
 
 # Define paths
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 INPUT_DIR = os.path.join(BASE_DIR, 'outputs', '07.0_filter-for-div')
 OUTPUT_DIR = os.path.join(BASE_DIR, 'outputs', '07_phylo-trees')
 
+# Trees cached by the content hash of the input sequences
+CACHE_DIR = os.path.join(OUTPUT_DIR, 'cache')
+
 # Input files (biological samples only)
 ASV_SEQS = os.path.join(INPUT_DIR, 'asv-rep-seqs-bio.qza')
 OTU_SEQS = os.path.join(INPUT_DIR, 'otu-rep-seqs-bio.qza')
@@ -27,24 +35,79 @@ OTU_SEQS = os.path.join(INPUT_DIR, 'otu-rep-seqs-bio.qza')
 # Create output directory
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-# Thread parameter
-N_THREADS = 'auto'
+# Thread parameter for one tree; main() splits the cores between the trees
+# it builds side by side
+N_THREADS = os.cpu_count() or 1
+
+# Pipeline outputs: (file suffix, label)
+TREE_OUTPUTS = [
+    ('alignment', 'Alignment'),
+    ('masked-alignment', 'Masked alignment'),
+    ('tree', 'Unrooted tree'),
+    ('rooted-tree', 'Rooted tree'),
+]
+
 
+def sequences_digest(sequences_path):
+    """
+    Content hash of a FeatureData[Sequence] artifact.
+    
+    Hashes the FASTA payload inside the .qza rather than the archive itself,
+    because every save writes a new UUID and provenance into the archive.
+    The QIIME2 version is included so trees are rebuilt after an upgrade.
+    """
+    digest = hashlib.sha256(qiime2.__version__.encode())
+    with zipfile.ZipFile(sequences_path) as archive:
+        for name in sorted(archive.namelist()):
+            if '/data/' in name:
+                with archive.open(name) as f:
+                    for chunk in iter(lambda: f.read(1 << 20), b''):
+                        digest.update(chunk)
+    return digest.hexdigest()
 
-def build_phylogeny(sequences_path, output_prefix, approach_name):
-    """Build phylogenetic tree using MAFFT-FastTree pipeline."""
+
+def build_phylogeny(sequences_path, output_prefix, approach_name, n_threads=N_THREADS):
+    """
+    Build phylogenetic tree using MAFFT-FastTree pipeline.
+    
+    Skipped if all outputs are newer than the input sequences. Results are
+    also cached in CACHE_DIR by the content hash of the input sequences;
+    unchanged sequences reuse the cached trees. FORCE_REBUILD=1 disables both.
+    """
     
     print("="*60)
     print(f"BUILDING PHYLOGENETIC TREE: {approach_name}")
     print("="*60)
     
+    output_paths = {
+        output: os.path.join(OUTPUT_DIR, f'{output_prefix}-{output}.qza')
+        for output, _ in TREE_OUTPUTS
+    }
+    
+    # Outputs newer than the input sequences are up to date
+    if all(is_up_to_date(path, sequences_path) for path in output_paths.values()):
+        print(f"\nOutputs are up to date, skipping (set FORCE_REBUILD=1 to rebuild)")
+        print(f"\n✓ {approach_name} PHYLOGENY COMPLETE (up to date)")
+        return tuple(output_paths.values())
+    
+    # Reuse cached trees if the sequences have not changed
+    cache_entry = os.path.join(CACHE_DIR, sequences_digest(sequences_path))
+    if not FORCE_REBUILD and os.path.isdir(cache_entry):
+        print(f"\nSequences unchanged, using cached trees:")
+        print(f"  {cache_entry}")
+        for output, label in TREE_OUTPUTS:
+            shutil.copyfile(os.path.join(cache_entry, f'{output}.qza'), output_paths[output])
+            print(f"  ✓ {label}: {output_paths[output]}")
+        print(f"\n✓ {approach_name} PHYLOGENY COMPLETE (cached)")
+        return tuple(output_paths.values())
+    
     print(f"\nLoading sequences:")
     print(f"  {sequences_path}")
     
-    sequences = Artifact.load(sequences_path)
+    sequences = load_artifact(sequences_path)
     
     print(f"\nRunning align-to-tree-mafft-fasttree pipeline...")
-    print(f"  Parameters: n_threads='{N_THREADS}'")
+    print(f"  Parameters: n_threads={n_threads}")
     print(f"\nThis will:")
     print(f"  1. Align sequences with MAFFT")
     print(f"  2. Mask highly variable positions")
@@ -54,31 +117,35 @@ def build_phylogeny(sequences_path, output_prefix, approach_name):
     # Run pipeline
     tree_results = phylogeny.pipelines.align_to_tree_mafft_fasttree(
         sequences=sequences,
-        n_threads=N_THREADS
+        n_threads=n_threads
     )
     
     # Save all outputs
     print(f"\nSaving outputs...")
     
-    alignment_path = os.path.join(OUTPUT_DIR, f'{output_prefix}-alignment.qza')
-    tree_results.alignment.save(alignment_path)
-    print(f"  ✓ Alignment: {alignment_path}")
-    
-    masked_alignment_path = os.path.join(OUTPUT_DIR, f'{output_prefix}-masked-alignment.qza')
-    tree_results.masked_alignment.save(masked_alignment_path)
-    print(f"  ✓ Masked alignment: {masked_alignment_path}")
-    
-    tree_path = os.path.join(OUTPUT_DIR, f'{output_prefix}-tree.qza')
-    tree_results.tree.save(tree_path)
-    print(f"  ✓ Unrooted tree: {tree_path}")
-    
-    rooted_tree_path = os.path.join(OUTPUT_DIR, f'{output_prefix}-rooted-tree.qza')
-    tree_results.rooted_tree.save(rooted_tree_path)
-    print(f"  ✓ Rooted tree: {rooted_tree_path}")
+    save_all([
+        (getattr(tree_results, output.replace('-', '_')), output_paths[output])
+        for output, _ in TREE_OUTPUTS
+    ])
+    for output, label in TREE_OUTPUTS:
+        print(f"  ✓ {label}: {output_paths[output]}")
+    
+    # Populate the cache; the entry only appears once it is complete
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_entry = tempfile.mkdtemp(dir=CACHE_DIR)
+    for output, _ in TREE_OUTPUTS:
+        shutil.copyfile(output_paths[output], os.path.join(tmp_entry, f'{output}.qza'))
+    if FORCE_REBUILD and os.path.isdir(cache_entry):
+        shutil.rmtree(cache_entry)
+    try:
+        os.replace(tmp_entry, cache_entry)
+    except OSError:
+        # Another run cached the same sequences first
+        shutil.rmtree(tmp_entry)
     
     print(f"\n✓ {approach_name} PHYLOGENY COMPLETE")
     
-    return alignment_path, masked_alignment_path, tree_path, rooted_tree_path
+    return tuple(output_paths.values())
 
 
 def main():
@@ -91,37 +158,28 @@ def main():
     print("="*60 + "\n")
     
     all_outputs = []
+    jobs = []
     
-    # Build ASV tree
+    # ASV tree
     if os.path.exists(ASV_SEQS):
-        print("\n" + "─"*60)
-        print("Processing ASV sequences...")
-        print("─"*60)
-        
-        asv_outputs = build_phylogeny(
-            ASV_SEQS,
-            'asv',
-            'ASV (DADA2)'
-        )
-        all_outputs.extend(asv_outputs)
+        jobs.append((ASV_SEQS, 'asv', 'ASV (DADA2)'))
     else:
         print(f"\n⚠️  ASV sequences not found, skipping...")
     
-    # Build OTU tree
+    # OTU tree
     if os.path.exists(OTU_SEQS):
-        print("\n" + "─"*60)
-        print("Processing OTU sequences...")
-        print("─"*60)
-        
-        otu_outputs = build_phylogeny(
-            OTU_SEQS,
-            'otu',
-            'OTU (vsearch)'
-        )
-        all_outputs.extend(otu_outputs)
+        jobs.append((OTU_SEQS, 'otu', 'OTU (vsearch)'))
     else:
         print(f"\n⚠️  OTU sequences not found, skipping...")
     
+    # The trees are independent: build them in parallel processes,
+    # each with its share of the cores.
+    if jobs:
+        print(f"\nProcessing {len(jobs)} approach(es) in parallel...")
+        n_threads = max(1, N_THREADS // len(jobs))
+        for outputs in run_parallel(build_phylogeny, [(*job, n_threads) for job in jobs]):
+            all_outputs.extend(outputs)
+    
     # Final summary
     print("\n" + "="*60)
     print("✓ TASK 7.1 COMPLETE: Phylogenetic Trees")
@@ -27,6 +27,7 @@ Notes:
   in your filtered tables (asv-table-bio.qza / otu-table-bio.qza).
 - The constants ASV_MAX_DEPTH and OTU_MAX_DEPTH below can be adjusted
   as needed after inspecting those summaries.
+- ASV and OTU are processed in parallel (one process each).
 """
 
 from pathlib import Path
@@ -34,6 +35,8 @@ from pathlib import Path
 from qiime2 import Artifact, Metadata
 from qiime2.plugins import diversity
 
+from _artifact_cache import run_parallel
+
 
 # ---------------------------------------------------------------------
 # Configuration
@@ -143,25 +146,16 @@ def main():
 
     print("Input files found. Starting alpha rarefaction analyses...\n")
 
-    # ASV-based alpha rarefaction
-    run_alpha_rarefaction(
-        table_path=ASV_TABLE,
-        tree_path=ASV_TREE,
-        metadata_path=METADATA_TSV,
-        max_depth=ASV_MAX_DEPTH,
-        output_viz_path=ASV_OUTPUT_VIZ,
-        label="ASV (DADA2)"
-    )
+    # (table, tree, metadata, max depth, output visualization, label)
+    jobs = [
+        # ASV-based alpha rarefaction
+        (ASV_TABLE, ASV_TREE, METADATA_TSV, ASV_MAX_DEPTH, ASV_OUTPUT_VIZ, "ASV (DADA2)"),
+        # OTU-based alpha rarefaction
+        (OTU_TABLE, OTU_TREE, METADATA_TSV, OTU_MAX_DEPTH, OTU_OUTPUT_VIZ, "OTU (vsearch 97%)"),
+    ]
 
-    # OTU-based alpha rarefaction
-    run_alpha_rarefaction(
-        table_path=OTU_TABLE,
-        tree_path=OTU_TREE,
-        metadata_path=METADATA_TSV,
-        max_depth=OTU_MAX_DEPTH,
-        output_viz_path=OTU_OUTPUT_VIZ,
-        label="OTU (vsearch 97%)"
-    )
+    # The two datasets are independent: run them in parallel processes.
+    run_parallel(run_alpha_rarefaction, jobs)
 
     print("======================================================================")
     print("Alpha rarefaction completed.")
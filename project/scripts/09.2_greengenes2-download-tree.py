@@ -4,20 +4,67 @@
 09.2_greengenes2-download-tree.py
 
 Download the Greengenes2 2022.10 rooted taxonomy tree (ASV-based).
+
+After a download passes the artifact check, its SHA256 is written next to
+it (.sha256). Later runs skip the download and the check if the file still
+matches that digest.
 """
 
+import hashlib
+import os
 import subprocess
+import zipfile
 from pathlib import Path
 import sys
 
+import yaml
+
+from _download import download
+
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 DEST = PROJECT_ROOT / "data/processed/gg2-taxonomy-asv-tree.qza"
+DEST_SHA256 = DEST.with_name(DEST.name + ".sha256")
 
 URL = (
     "http://ftp.microbio.me/greengenes_release/2022.10/"
     "2022.10.taxonomy.asv.nwk.qza"
 )
 
+
+def file_sha256(path):
+    """SHA256 hex digest of a file, read in 1 MiB chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_verified(path, sha256_path):
+    """True if path matches the digest recorded after its last verified download."""
+    if not path.exists() or not sha256_path.exists():
+        return False
+    parts = sha256_path.read_text().split()
+    return bool(parts) and parts[0] == file_sha256(path)
+
+
+def write_sha256(path, sha256_path):
+    """Record the digest of path; written to a temp file and renamed into place."""
+    tmp_path = sha256_path.with_name(sha256_path.name + ".tmp")
+    tmp_path.write_text(f"{file_sha256(path)}  {path.name}\n")
+    os.replace(tmp_path, sha256_path)
+
+
+def peek(path):
+    """Print UUID, type and format of a .qza (like `qiime tools peek`)."""
+    with zipfile.ZipFile(path) as z:
+        root = z.namelist()[0].split("/")[0]
+        meta = yaml.safe_load(z.read(f"{root}/metadata.yaml"))
+    print(f"UUID:        {meta['uuid']}")
+    print(f"Type:        {meta['type']}")
+    print(f"Data format: {meta['format']}")
+
+
 def main():
     print("======================================================================")
     print("TASK 09.2: DOWNLOAD GREENGENES2 TAXONOMY TREE")
@@ -26,28 +73,31 @@ def main():
     # Ensure directory exists
     (PROJECT_ROOT / "data/processed").mkdir(parents=True, exist_ok=True)
 
+    if is_verified(DEST, DEST_SHA256):
+        print(f"Tree already downloaded and verified: {DEST}")
+        print("\nGreengenes2 taxonomy tree setup complete.")
+        print("======================================================================")
+        return
+
     print(f"Downloading Greengenes2 taxonomy tree -> {DEST}\n")
     try:
-        subprocess.run(
-            ["wget", "-O", str(DEST), URL],
-            check=True
-        )
-    except subprocess.CalledProcessError:
-        print("ERROR: wget failed. Please check your network or the URL.")
+        download(URL, DEST)
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        print("ERROR: Download failed. Please check your network or the URL.")
         sys.exit(1)
 
     print("\nDownload complete.\n")
 
-    print("Sanity check (qiime tools peek):\n")
+    print("Sanity check (artifact metadata):\n")
     try:
-        subprocess.run(
-            ["qiime", "tools", "peek", str(DEST)],
-            check=True
-        )
-    except subprocess.CalledProcessError:
-        print("WARNING: qiime tools peek failed. Check if QIIME2 is active.")
+        peek(DEST)
+    except (zipfile.BadZipFile, KeyError, IndexError):
+        print("ERROR: Downloaded file is not a valid QIIME2 artifact.")
         sys.exit(1)
 
+    # Record the digest of the verified download
+    write_sha256(DEST, DEST_SHA256)
+
     print("\nGreengenes2 taxonomy tree setup complete.")
     print("======================================================================")
 
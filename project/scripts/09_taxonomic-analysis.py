@@ -21,6 +21,7 @@ This script:
 3. Generates interactive taxa barplots for ASV and OTU tables.
 """
 
+import os
 from pathlib import Path
 
 from qiime2 import Artifact, Metadata
@@ -54,6 +55,9 @@ OTU_TAXONOMY = OUTPUT_DIR / "otu-taxonomy.qza"
 OTU_TAXONOMY_VIZ = OUTPUT_DIR / "otu-taxonomy.qzv"
 OTU_TAXA_BAR = OUTPUT_DIR / "otu-taxa-bar-plots.qzv"
 
+# classify_sklearn worker processes (leave one core free)
+N_JOBS = max(1, (os.cpu_count() or 1) - 1)
+
 
 # ---------------------------------------------------------------------
 # Helpers
@@ -82,8 +86,14 @@ def run_taxonomy_pipeline(label: str,
                           table_path: Path,
                           taxonomy_artifact_path: Path,
                           taxonomy_viz_path: Path,
-                          barplot_path: Path):
-    """Run classify_sklearn + tabulate + barplot for one dataset."""
+                          barplot_path: Path,
+                          classifier: Artifact,
+                          sample_metadata: Metadata):
+    """Run classify_sklearn + tabulate + barplot for one dataset.
+
+    The classifier and sample metadata are loaded once in main() and shared
+    by the ASV and OTU runs.
+    """
     print("------------------------------------------------------------------")
     print(f"Running Greengenes2 taxonomic analysis for {label}")
     print(f"Rep-seqs: {rep_seqs_path}")
@@ -92,15 +102,15 @@ def run_taxonomy_pipeline(label: str,
     print("------------------------------------------------------------------")
 
     rep_seqs = Artifact.load(str(rep_seqs_path))
-    classifier = Artifact.load(str(CLASSIFIER))
     table = Artifact.load(str(table_path))
-    sample_metadata = Metadata.load(str(METADATA_TSV))
 
     # 1) classify_sklearn
     print(f"[{label}] Classifying sequences with Greengenes2 NB classifier...")
     taxonomy_res = feature_classifier.methods.classify_sklearn(
         reads=rep_seqs,
-        classifier=classifier
+        classifier=classifier,
+        n_jobs=N_JOBS,
+        reads_per_batch="auto"
     )
     taxonomy = taxonomy_res.classification
     taxonomy.save(str(taxonomy_artifact_path))
@@ -149,6 +159,11 @@ def main():
 
     print("Input files found. Starting taxonomic classification and barplot generation...\n")
 
+    # The classifier is large; load it (and the metadata) once for both datasets
+    print("Loading Greengenes2 classifier and sample metadata...\n")
+    classifier = Artifact.load(str(CLASSIFIER))
+    sample_metadata = Metadata.load(str(METADATA_TSV))
+
     # ASV
     run_taxonomy_pipeline(
         label="ASV (DADA2)",
@@ -156,7 +171,9 @@ def main():
         table_path=ASV_TABLE,
         taxonomy_artifact_path=ASV_TAXONOMY,
         taxonomy_viz_path=ASV_TAXONOMY_VIZ,
-        barplot_path=ASV_TAXA_BAR
+        barplot_path=ASV_TAXA_BAR,
+        classifier=classifier,
+        sample_metadata=sample_metadata
     )
 
     # OTU
@@ -166,7 +183,9 @@ def main():
         table_path=OTU_TABLE,
         taxonomy_artifact_path=OTU_TAXONOMY,
         taxonomy_viz_path=OTU_TAXONOMY_VIZ,
-        barplot_path=OTU_TAXA_BAR
+        barplot_path=OTU_TAXA_BAR,
+        classifier=classifier,
+        sample_metadata=sample_metadata
     )
 
     print("======================================================================")
@@ -34,13 +34,19 @@ Outputs (relative to project root):
 - outputs/10_ancombc/otu/table-l6.qza
 - outputs/10_ancombc/otu/l6-ancombc-<formula>.qza
 - outputs/10_ancombc/otu/l6-da-barplot-<formula>.qzv
+
+The genus-level tables are collapsed first, then the four ANCOM-BC fits
+run in parallel processes. Outputs that are newer than their inputs are
+reused instead of being recomputed; the DA barplots are also redone when this
+script (e.g. ALPHA) is edited. Set FORCE_REBUILD=1 to recompute everything.
 """
 
 from pathlib import Path
 
-import pandas as pd
+import biom
 from qiime2 import Artifact, Metadata
 from qiime2.plugins import composition, taxa
+from _artifact_cache import is_up_to_date, run_parallel
 
 
 # ---------------------------------------------------------------------
@@ -96,7 +102,7 @@ def check_inputs():
 
 
 def validate_formula_column(meta: Metadata, formula: str):
-    cols = set(meta.to_dataframe().columns)
+    cols = set(meta.columns)  # column names only, no DataFrame needed
     if formula not in cols:
         print(f"ERROR: Formula column '{formula}' not found in metadata.")
         print("Available columns:")
@@ -108,34 +114,22 @@ def validate_formula_column(meta: Metadata, formula: str):
 def filter_metadata_to_table(meta: Metadata, table: Artifact) -> Metadata:
     """
     Restrict metadata to sample IDs that are present in the feature table.
-    Automatically detects whether sample IDs are in the table's index or columns.
+    Only the table's sample IDs are read (from the sparse BIOM table), the
+    counts are never converted to a dense DataFrame.
     """
-    df = table.view(pd.DataFrame)        # orientation can vary
+    table_ids = set(table.view(biom.Table).ids(axis="sample"))
     meta_df = meta.to_dataframe()
-
-    table_idx = set(df.index)
-    table_cols = set(df.columns)
     meta_ids = set(meta_df.index)
 
-    overlap_cols = meta_ids & table_cols
-    overlap_idx = meta_ids & table_idx
-
-    if overlap_cols:
-        sample_ids = sorted(overlap_cols)
-        loc_axis = "columns"
-    elif overlap_idx:
-        sample_ids = sorted(overlap_idx)
-        loc_axis = "index"
-    else:
+    sample_ids = sorted(meta_ids & table_ids)
+    if not sample_ids:
         print("ERROR: No overlapping sample IDs between table and metadata.")
         print("Example metadata IDs:", sorted(list(meta_ids))[:10])
-        print("Example table index IDs:", sorted(list(table_idx))[:10])
-        print("Example table column IDs:", sorted(list(table_cols))[:10])
+        print("Example table sample IDs:", sorted(list(table_ids))[:10])
         raise SystemExit(1)
 
     dropped_meta = meta_ids - set(sample_ids)
     if dropped_meta:
-        print(f"Note: using table {loc_axis} as sample IDs.")
         print("The following metadata samples are not in the table and "
               "will be dropped before ANCOM-BC:")
         for s in sorted(dropped_meta):
@@ -146,98 +140,76 @@ def filter_metadata_to_table(meta: Metadata, table: Artifact) -> Metadata:
     return Metadata(filtered_meta_df)
 
 
-def run_ancombc_for_table(label: str,
-                          table_path: Path,
-                          taxonomy_path: Path,
-                          out_dir: Path):
-    """
-    Run ANCOM-BC on:
-      - original feature table
-      - table collapsed at genus level (L6)
-    """
-    print("------------------------------------------------------------------")
-    print(f"Running ANCOM-BC for {label}")
-    print(f"Table:    {table_path}")
-    print(f"Taxonomy: {taxonomy_path}")
-    print(f"Formula:  {FORMULA}")
-    print("------------------------------------------------------------------")
-
+def collapse_to_genus(label: str,
+                      table_path: Path,
+                      taxonomy_path: Path,
+                      out_dir: Path) -> Path:
+    """Collapse a feature table at genus level (L6) and return its path."""
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    table = Artifact.load(str(table_path))
-    taxonomy = Artifact.load(str(taxonomy_path))
-    meta = Metadata.load(str(METADATA_TSV))
-
-    # Validate column exists
-    validate_formula_column(meta, FORMULA)
-
-    # Filter metadata down to samples present in the table (robust to orientation)
-    meta_filtered = filter_metadata_to_table(meta, table)
-
-    # --------------------------
-    # 1) Feature-level ANCOM-BC
-    # --------------------------
-    print(f"[{label}] Running ANCOM-BC at feature (ASV/OTU) level...")
-
-    ancom_res = composition.methods.ancombc(
-        table=table,
-        metadata=meta_filtered,
-        formula=FORMULA
-    )
-    diff = ancom_res.differentials
-    diff_path = out_dir / f"ancombc-{FORMULA}.qza"
-    diff.save(str(diff_path))
-
-    print(f"[{label}] Creating DA barplot (feature-level)...")
-    da_viz = composition.visualizers.da_barplot(
-        data=diff,
-        significance_threshold=ALPHA
-    )
-    da_viz_path = out_dir / f"da-barplot-{FORMULA}.qzv"
-    da_viz.visualization.save(str(da_viz_path))
-
-    print(f"[{label}] Feature-level outputs:")
-    print(f"  Differentials : {diff_path}")
-    print(f"  DA barplot    : {da_viz_path}")
-    print()
+    collapsed_table_path = out_dir / f"table-l{GENUS_LEVEL}.qza"
+    if is_up_to_date(collapsed_table_path, table_path, taxonomy_path):
+        print(f"[{label}] Genus-level (L{GENUS_LEVEL}) table is up to date, reusing it.")
+        return collapsed_table_path
 
-    # -------------------------------------------
-    # 2) Collapse to genus level (L6) and rerun
-    # -------------------------------------------
     print(f"[{label}] Collapsing table at genus level (L{GENUS_LEVEL})...")
 
     collapsed_res = taxa.methods.collapse(
-        table=table,
-        taxonomy=taxonomy,
+        table=Artifact.load(str(table_path)),
+        taxonomy=Artifact.load(str(taxonomy_path)),
         level=GENUS_LEVEL
     )
-    collapsed_table = collapsed_res.collapsed_table
-    collapsed_table_path = out_dir / f"table-l{GENUS_LEVEL}.qza"
-    collapsed_table.save(str(collapsed_table_path))
+    collapsed_res.collapsed_table.save(str(collapsed_table_path))
+    print(f"  Collapsed table : {collapsed_table_path}")
 
-    print(f"[{label}] Running ANCOM-BC at genus level (L{GENUS_LEVEL})...")
+    return collapsed_table_path
 
-    ancom_l_res = composition.methods.ancombc(
-        table=collapsed_table,
-        metadata=meta_filtered,
-        formula=FORMULA
-    )
-    diff_l = ancom_l_res.differentials
-    diff_l_path = out_dir / f"l{GENUS_LEVEL}-ancombc-{FORMULA}.qza"
-    diff_l.save(str(diff_l_path))
-
-    print(f"[{label}] Creating DA barplot (genus-level)...")
-    da_l_viz = composition.visualizers.da_barplot(
-        data=diff_l,
-        significance_threshold=ALPHA
-    )
-    da_l_viz_path = out_dir / f"l{GENUS_LEVEL}-da-barplot-{FORMULA}.qzv"
-    da_l_viz.visualization.save(str(da_l_viz_path))
 
-    print(f"[{label}] Genus-level outputs:")
-    print(f"  Collapsed table : {collapsed_table_path}")
-    print(f"  Differentials   : {diff_l_path}")
-    print(f"  DA barplot      : {da_l_viz_path}")
+def fit_ancombc(label: str,
+                table_path: Path,
+                meta: Metadata,
+                diff_path: Path,
+                da_viz_path: Path):
+    """
+    Run ANCOM-BC and the DA barplot for one table.
+
+    Runs in a worker process; `meta` is the sample metadata loaded (and
+    validated) once in main().
+    """
+    print(f"[{label}] Table:    {table_path}")
+
+    if is_up_to_date(diff_path, table_path, METADATA_TSV):
+        print(f"[{label}] ANCOM-BC is up to date, reusing it.")
+        diff = Artifact.load(str(diff_path))
+    else:
+        table = Artifact.load(str(table_path))
+
+        # Filter metadata down to samples present in the table
+        meta_filtered = filter_metadata_to_table(meta, table)
+
+        print(f"[{label}] Running ANCOM-BC...")
+
+        ancom_res = composition.methods.ancombc(
+            table=table,
+            metadata=meta_filtered,
+            formula=FORMULA
+        )
+        diff = ancom_res.differentials
+        diff.save(str(diff_path))
+
+    # ALPHA is not part of the file name: also redo the barplot when this
+    # script (and with it possibly the threshold) was edited
+    if not is_up_to_date(da_viz_path, diff_path, __file__):
+        print(f"[{label}] Creating DA barplot...")
+        da_viz = composition.visualizers.da_barplot(
+            data=diff,
+            significance_threshold=ALPHA
+        )
+        da_viz.visualization.save(str(da_viz_path))
+
+    print(f"[{label}] Outputs:")
+    print(f"  Differentials : {diff_path}")
+    print(f"  DA barplot    : {da_viz_path}")
     print()
 
 
@@ -257,21 +229,29 @@ def main():
     print(f"Using formula (ANCOM-BC): {FORMULA}")
     print(f"Significance threshold (da-barplot): {ALPHA}\n")
 
-    # ASV-level + genus-level
-    run_ancombc_for_table(
-        label="ASV (DADA2)",
-        table_path=ASV_TABLE,
-        taxonomy_path=ASV_TAXONOMY,
-        out_dir=ASV_DIR
-    )
+    # Load metadata once for both datasets and validate the formula column
+    meta = Metadata.load(str(METADATA_TSV))
+    validate_formula_column(meta, FORMULA)
 
-    # OTU-level + genus-level
-    run_ancombc_for_table(
-        label="OTU (vsearch 97%)",
-        table_path=OTU_TABLE,
-        taxonomy_path=OTU_TAXONOMY,
-        out_dir=OTU_DIR
-    )
+    jobs = []
+    for label, table_path, taxonomy_path, out_dir in [
+        ("ASV (DADA2)", ASV_TABLE, ASV_TAXONOMY, ASV_DIR),
+        ("OTU (vsearch 97%)", OTU_TABLE, OTU_TAXONOMY, OTU_DIR),
+    ]:
+        # Genus-level tables are needed before their ANCOM-BC fits can start
+        collapsed_table_path = collapse_to_genus(label, table_path, taxonomy_path, out_dir)
+
+        # Feature-level (ASV/OTU) and genus-level (L6) fits
+        jobs.append((label, table_path, meta,
+                     out_dir / f"ancombc-{FORMULA}.qza",
+                     out_dir / f"da-barplot-{FORMULA}.qzv"))
+        jobs.append((f"{label} L{GENUS_LEVEL}", collapsed_table_path, meta,
+                     out_dir / f"l{GENUS_LEVEL}-ancombc-{FORMULA}.qza",
+                     out_dir / f"l{GENUS_LEVEL}-da-barplot-{FORMULA}.qzv"))
+
+    # The four ANCOM-BC fits are independent: run them in parallel processes.
+    print(f"\nRunning {len(jobs)} ANCOM-BC fits in parallel...\n")
+    run_parallel(fit_ancombc, jobs)
 
     print("======================================================================")
     print("ANCOM-BC differential abundance testing completed.")
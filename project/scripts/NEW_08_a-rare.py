@@ -8,12 +8,13 @@ Task 7.2: Alpha rarefaction plotting
 - Generates rarefaction curves to assess if sampling depth is adequate
 - Shows if richness plateaus (full observation) or continues increasing
 - Displays sample retention at each rarefaction depth
-- Processes both ASV and OTU datasets
+- Processes both ASV and OTU datasets (in parallel processes)
 """
 
 import os
 from qiime2 import Artifact, Metadata
 from qiime2.plugins import diversity
+from _artifact_cache import is_up_to_date, run_parallel
 
 # Define paths
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -46,6 +47,12 @@ def run_alpha_rarefaction(table_path, tree_path, output_prefix, approach_name, m
     print(f"ALPHA RAREFACTION: {approach_name}")
     print("="*60)
     
+    output_path = os.path.join(OUTPUT_DIR, f'{output_prefix}-alpha-rarefaction.qzv')
+    if is_up_to_date(output_path, table_path, tree_path, METADATA_FILE):
+        print(f"\n{output_prefix}-alpha-rarefaction.qzv is up to date, skipping "
+              f"(set FORCE_REBUILD=1 to recompute)")
+        return output_path
+    
     # Load inputs
     table = Artifact.load(table_path)
     tree = Artifact.load(tree_path)
@@ -66,7 +73,6 @@ def run_alpha_rarefaction(table_path, tree_path, output_prefix, approach_name, m
     )
     
     # Save visualization
-    output_path = os.path.join(OUTPUT_DIR, f'{output_prefix}-alpha-rarefaction.qzv')
     rarefaction_viz.visualization.save(output_path)
     print(f"  ✓ Saved: {output_prefix}-alpha-rarefaction.qzv")
     
@@ -88,41 +94,26 @@ def main():
     print("="*60 + "\n")
     
     completed_analyses = []
+    jobs = []
     
-    # Process ASV data
+    # ASV data
     if os.path.exists(ASV_TABLE) and os.path.exists(ASV_TREE):
-        print("─"*60)
-        print("Processing ASV data...")
-        print("─"*60)
-        
-        asv_output = run_alpha_rarefaction(
-            table_path=ASV_TABLE,
-            tree_path=ASV_TREE,
-            output_prefix='asv',
-            approach_name='ASV (DADA2)',
-            max_depth=4000
-        )
-        completed_analyses.append(('ASV', asv_output))
+        jobs.append(('ASV', (ASV_TABLE, ASV_TREE, 'asv', 'ASV (DADA2)', 4000)))
     else:
         print(f"\n⚠️  ASV data not found, skipping...")
     
-    # Process OTU data
+    # OTU data
     if os.path.exists(OTU_TABLE) and os.path.exists(OTU_TREE):
-        print("\n" + "─"*60)
-        print("Processing OTU data...")
-        print("─"*60)
-        
-        otu_output = run_alpha_rarefaction(
-            table_path=OTU_TABLE,
-            tree_path=OTU_TREE,
-            output_prefix='otu',
-            approach_name='OTU (vsearch)',
-            max_depth=4000
-        )
-        completed_analyses.append(('OTU', otu_output))
+        jobs.append(('OTU', (OTU_TABLE, OTU_TREE, 'otu', 'OTU (vsearch)', 4000)))
     else:
         print(f"\n⚠️  OTU data not found, skipping...")
     
+    # The approaches are independent: run them in parallel processes.
+    if jobs:
+        print(f"Processing {len(jobs)} approach(es) in parallel...\n")
+        output_paths = run_parallel(run_alpha_rarefaction, [args for _, args in jobs])
+        completed_analyses.extend(zip([approach for approach, _ in jobs], output_paths))
+    
     # Final summary
     print("\n" + "="*60)
     print("✓ TASK 7.2 COMPLETE: Alpha Rarefaction Plotting")
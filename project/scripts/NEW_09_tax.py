@@ -12,11 +12,12 @@ Task 9: Taxonomic classification
 """
 
 import os
-import subprocess
 from qiime2 import Artifact, Metadata
 import qiime2.plugins.feature_classifier.actions as feature_classifier_actions
 import qiime2.plugins.metadata.actions as metadata_actions
 import qiime2.plugins.taxa.actions as taxa_actions
+from _artifact_cache import is_up_to_date
+from _download import download
 
 # Define paths
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -35,6 +36,9 @@ OTU_TABLE = os.path.join(BASE_DIR, 'outputs', '07.0_filter-for-div', 'otu-table-
 # Create output directory
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+# classify_sklearn worker processes (leave one core free)
+N_JOBS = max(1, (os.cpu_count() or 1) - 1)
+
 # Greengenes2 classifier URL
 CLASSIFIER_URL = (
     "https://ftp.microbio.me/greengenes_release/2022.10/"
@@ -43,6 +47,11 @@ CLASSIFIER_URL = (
 )
 
 
+def taxonomy_output(output_prefix):
+    """Path of the taxonomy artifact for an approach."""
+    return os.path.join(OUTPUT_DIR, f'{output_prefix}-taxonomy.qza')
+
+
 def download_classifier():
     """Download Greengenes2 V4 Naive Bayes classifier if not present."""
     if os.path.exists(CLASSIFIER_PATH):
@@ -55,16 +64,12 @@ def download_classifier():
     # Ensure directory exists
     os.makedirs(os.path.dirname(CLASSIFIER_PATH), exist_ok=True)
     
-    # Download
-    subprocess.run(
-        ['wget', '-O', CLASSIFIER_PATH, CLASSIFIER_URL],
-        check=True
-    )
+    download(CLASSIFIER_URL, CLASSIFIER_PATH)
     
     print(f"✓ Downloaded: {os.path.basename(CLASSIFIER_PATH)}")
 
 
-def classify_taxonomy(rep_seqs_path, table_path, output_prefix, approach_name):
+def classify_taxonomy(rep_seqs_path, table_path, output_prefix, approach_name, classifier):
     """
     Assign taxonomy using Greengenes2 Naive Bayes classifier.
     
@@ -78,6 +83,12 @@ def classify_taxonomy(rep_seqs_path, table_path, output_prefix, approach_name):
         Prefix for output files (e.g., 'asv' or 'otu')
     approach_name : str
         Display name for the approach
+    classifier : Artifact
+        Classifier loaded once in main() and shared by ASV and OTU
+        (None if the taxonomy is up to date)
+    
+    Outputs newer than their inputs are reused (set FORCE_REBUILD=1 to
+    recompute them).
     """
     print("="*60)
     print(f"TAXONOMIC CLASSIFICATION: {approach_name}")
@@ -86,47 +97,55 @@ def classify_taxonomy(rep_seqs_path, table_path, output_prefix, approach_name):
     # Load inputs
     rep_seqs = Artifact.load(rep_seqs_path)
     table = Artifact.load(table_path)
-    classifier = Artifact.load(CLASSIFIER_PATH)
     sample_metadata = Metadata.load(METADATA_FILE)
     
     print(f"\nRep seqs: {os.path.basename(rep_seqs_path)}")
     print(f"Table: {os.path.basename(table_path)}")
     print(f"Classifier: Greengenes2 2022.10 V4 (sklearn 1.4.2)")
     
-    # Classify sequences
-    print(f"\nClassifying sequences...")
-    taxonomy, = feature_classifier_actions.classify_sklearn(
-        classifier=classifier,
-        reads=rep_seqs
-    )
-    
-    # Save taxonomy
-    taxonomy_path = os.path.join(OUTPUT_DIR, f'{output_prefix}-taxonomy.qza')
-    taxonomy.save(taxonomy_path)
-    print(f"  ✓ Saved: {output_prefix}-taxonomy.qza")
+    taxonomy_path = taxonomy_output(output_prefix)
+    if is_up_to_date(taxonomy_path, rep_seqs_path, CLASSIFIER_PATH):
+        print(f"\n{output_prefix}-taxonomy.qza is up to date, reusing it")
+        taxonomy = Artifact.load(taxonomy_path)
+    else:
+        # Classify sequences
+        print(f"\nClassifying sequences (n_jobs={N_JOBS})...")
+        # reads_per_batch='auto' splits the reads evenly over the n_jobs workers
+        taxonomy, = feature_classifier_actions.classify_sklearn(
+            classifier=classifier,
+            reads=rep_seqs,
+            n_jobs=N_JOBS,
+            reads_per_batch='auto'
+        )
+        
+        # Save taxonomy
+        taxonomy.save(taxonomy_path)
+        print(f"  ✓ Saved: {output_prefix}-taxonomy.qza")
     
     # Generate taxonomy visualization
-    print(f"\nGenerating taxonomy visualization...")
-    taxonomy_as_md = taxonomy.view(Metadata)
-    taxonomy_viz, = metadata_actions.tabulate(
-        input=taxonomy_as_md
-    )
-    
     taxonomy_viz_path = os.path.join(OUTPUT_DIR, f'{output_prefix}-taxonomy.qzv')
-    taxonomy_viz.save(taxonomy_viz_path)
-    print(f"  ✓ Saved: {output_prefix}-taxonomy.qzv")
+    if not is_up_to_date(taxonomy_viz_path, taxonomy_path):
+        print(f"\nGenerating taxonomy visualization...")
+        taxonomy_as_md = taxonomy.view(Metadata)
+        taxonomy_viz, = metadata_actions.tabulate(
+            input=taxonomy_as_md
+        )
+        
+        taxonomy_viz.save(taxonomy_viz_path)
+        print(f"  ✓ Saved: {output_prefix}-taxonomy.qzv")
     
     # Generate taxonomy bar plots
-    print(f"\nGenerating taxonomy bar plots...")
-    barplot_viz, = taxa_actions.barplot(
-        table=table,
-        taxonomy=taxonomy,
-        metadata=sample_metadata
-    )
-    
     barplot_path = os.path.join(OUTPUT_DIR, f'{output_prefix}-taxa-barplot.qzv')
-    barplot_viz.save(barplot_path)
-    print(f"  ✓ Saved: {output_prefix}-taxa-barplot.qzv")
+    if not is_up_to_date(barplot_path, table_path, taxonomy_path, METADATA_FILE):
+        print(f"\nGenerating taxonomy bar plots...")
+        barplot_viz, = taxa_actions.barplot(
+            table=table,
+            taxonomy=taxonomy,
+            metadata=sample_metadata
+        )
+        
+        barplot_viz.save(barplot_path)
+        print(f"  ✓ Saved: {output_prefix}-taxa-barplot.qzv")
     
     print(f"\n✓ {approach_name} TAXONOMIC CLASSIFICATION COMPLETE")
     
@@ -150,6 +169,14 @@ def main():
     print("─"*60)
     download_classifier()
     
+    # Load the (large) classifier once for both approaches, unless every
+    # taxonomy is already up to date
+    classifier = None
+    if not all(is_up_to_date(taxonomy_output(prefix), seqs_path, CLASSIFIER_PATH)
+               for seqs_path, prefix in ((ASV_SEQS, 'asv'), (OTU_SEQS, 'otu'))
+               if os.path.exists(seqs_path)):
+        classifier = Artifact.load(CLASSIFIER_PATH)
+    
     completed_analyses = []
     
     # Process ASV data
@@ -162,7 +189,8 @@ def main():
             rep_seqs_path=ASV_SEQS,
             table_path=ASV_TABLE,
             output_prefix='asv',
-            approach_name='ASV (DADA2)'
+            approach_name='ASV (DADA2)',
+            classifier=classifier
         )
         completed_analyses.append(('ASV', asv_outputs))
     else:
@@ -178,7 +206,8 @@ def main():
             rep_seqs_path=OTU_SEQS,
             table_path=OTU_TABLE,
             output_prefix='otu',
-            approach_name='OTU (vsearch)'
+            approach_name='OTU (vsearch)',
+            classifier=classifier
         )
         completed_analyses.append(('OTU', otu_outputs))
     else:
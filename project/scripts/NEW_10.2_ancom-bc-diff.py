@@ -2,11 +2,14 @@
 """
 Script 10.2: ANCOM-BC Differential Abundance Analysis
 Run ANCOM-BC on filtered tables to identify features that differ by disease state.
+The four tables (ASV/OTU x Gum/Plaque) are analysed in parallel processes.
+Results newer than their inputs are kept (set FORCE_REBUILD=1 to recompute them).
 """
 import os
-import pandas as pd
+import biom
 from qiime2 import Artifact, Metadata
 import qiime2.plugins.composition.actions as composition_actions
+from _artifact_cache import is_up_to_date, load_underscored_metadata, run_parallel
 
 # Define paths
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -14,101 +17,67 @@ METADATA_FILE = os.path.join(BASE_DIR, 'data', 'processed', 'sample-metadata.tsv
 ASV_OUTPUT_DIR = os.path.join(BASE_DIR, 'outputs', '10_ancombc_asv')
 OTU_OUTPUT_DIR = os.path.join(BASE_DIR, 'outputs', '10_ancombc_otu')
 
-# Load metadata and rename columns
-sample_metadata_original = Metadata.load(METADATA_FILE)
-sample_metadata_df = sample_metadata_original.to_dataframe()
-sample_metadata_df.columns = sample_metadata_df.columns.str.replace('-', '_')
-
-print("\n" + "="*60)
-print("Running ANCOM-BC on Gum samples (ASV)")
-print("="*60)
-
-asv_gum_table = Artifact.load(os.path.join(ASV_OUTPUT_DIR, 'asv_gum_table.qza'))
-gum_sample_ids = asv_gum_table.view(pd.DataFrame).index.tolist()
-gum_metadata_df = sample_metadata_df.loc[sample_metadata_df.index.isin(gum_sample_ids)]
-gum_metadata_md = Metadata(gum_metadata_df)
-
-ancombc_asv_gum, = composition_actions.ancombc(
-    table=asv_gum_table,
-    metadata=gum_metadata_md,
-    formula='disease_state',
-)
-ancombc_asv_gum.save(os.path.join(ASV_OUTPUT_DIR, 'ancombc_asv_gum.qza'))
-print(f"Saved: {ASV_OUTPUT_DIR}/ancombc_asv_gum.qza")
-
-da_barplot_asv_gum_viz, = composition_actions.da_barplot(
-    data=ancombc_asv_gum,
-    significance_threshold=0.001,
-)
-da_barplot_asv_gum_viz.save(os.path.join(ASV_OUTPUT_DIR, 'da_barplot_asv_gum.qzv'))
-print(f"Saved: {ASV_OUTPUT_DIR}/da_barplot_asv_gum.qzv")
-
-print("\n" + "="*60)
-print("Running ANCOM-BC on Plaque samples (ASV)")
-print("="*60)
-
-asv_plaque_table = Artifact.load(os.path.join(ASV_OUTPUT_DIR, 'asv_plaque_table.qza'))
-plaque_sample_ids = asv_plaque_table.view(pd.DataFrame).index.tolist()
-plaque_metadata_df = sample_metadata_df.loc[sample_metadata_df.index.isin(plaque_sample_ids)]
-plaque_metadata_md = Metadata(plaque_metadata_df)
-
-ancombc_asv_plaque, = composition_actions.ancombc(
-    table=asv_plaque_table,
-    metadata=plaque_metadata_md,
-    formula='disease_state',
-)
-ancombc_asv_plaque.save(os.path.join(ASV_OUTPUT_DIR, 'ancombc_asv_plaque.qza'))
-print(f"Saved: {ASV_OUTPUT_DIR}/ancombc_asv_plaque.qza")
-
-da_barplot_asv_plaque_viz, = composition_actions.da_barplot(
-    data=ancombc_asv_plaque,
-    significance_threshold=0.001,
-)
-da_barplot_asv_plaque_viz.save(os.path.join(ASV_OUTPUT_DIR, 'da_barplot_asv_plaque.qzv'))
-print(f"Saved: {ASV_OUTPUT_DIR}/da_barplot_asv_plaque.qzv")
-
-print("\n" + "="*60)
-print("Running ANCOM-BC on Gum samples (OTU)")
-print("="*60)
-
-otu_gum_table = Artifact.load(os.path.join(OTU_OUTPUT_DIR, 'otu_gum_table.qza'))
-
-ancombc_otu_gum, = composition_actions.ancombc(
-    table=otu_gum_table,
-    metadata=gum_metadata_md,
-    formula='disease_state',
-)
-ancombc_otu_gum.save(os.path.join(OTU_OUTPUT_DIR, 'ancombc_otu_gum.qza'))
-print(f"Saved: {OTU_OUTPUT_DIR}/ancombc_otu_gum.qza")
-
-da_barplot_otu_gum_viz, = composition_actions.da_barplot(
-    data=ancombc_otu_gum,
-    significance_threshold=0.001,
-)
-da_barplot_otu_gum_viz.save(os.path.join(OTU_OUTPUT_DIR, 'da_barplot_otu_gum.qzv'))
-print(f"Saved: {OTU_OUTPUT_DIR}/da_barplot_otu_gum.qzv")
-
-print("\n" + "="*60)
-print("Running ANCOM-BC on Plaque samples (OTU)")
-print("="*60)
-
-otu_plaque_table = Artifact.load(os.path.join(OTU_OUTPUT_DIR, 'otu_plaque_table.qza'))
-
-ancombc_otu_plaque, = composition_actions.ancombc(
-    table=otu_plaque_table,
-    metadata=plaque_metadata_md,
-    formula='disease_state',
-)
-ancombc_otu_plaque.save(os.path.join(OTU_OUTPUT_DIR, 'ancombc_otu_plaque.qza'))
-print(f"Saved: {OTU_OUTPUT_DIR}/ancombc_otu_plaque.qza")
-
-da_barplot_otu_plaque_viz, = composition_actions.da_barplot(
-    data=ancombc_otu_plaque,
-    significance_threshold=0.001,
-)
-da_barplot_otu_plaque_viz.save(os.path.join(OTU_OUTPUT_DIR, 'da_barplot_otu_plaque.qzv'))
-print(f"Saved: {OTU_OUTPUT_DIR}/da_barplot_otu_plaque.qzv")
-
-print("\n" + "="*60)
-print("All ANCOM-BC analyses completed successfully!")
-print("="*60)
\ No newline at end of file
+# (output directory, prefix, label, sample type) of each filtered table from 10.1
+ANALYSES = [
+    (ASV_OUTPUT_DIR, 'asv', 'ASV', 'Gum'),
+    (ASV_OUTPUT_DIR, 'asv', 'ASV', 'Plaque'),
+    (OTU_OUTPUT_DIR, 'otu', 'OTU', 'Gum'),
+    (OTU_OUTPUT_DIR, 'otu', 'OTU', 'Plaque'),
+]
+
+
+def run_ancombc(output_dir, prefix, label, sample_type, sample_metadata_df):
+    """Run ANCOM-BC and the DA barplot on one filtered table."""
+    name = f'{prefix}_{sample_type.lower()}'
+
+    print("\n" + "="*60)
+    print(f"Running ANCOM-BC on {sample_type} samples ({label})")
+    print("="*60)
+
+    table_path = os.path.join(output_dir, f'{name}_table.qza')
+    ancombc_path = os.path.join(output_dir, f'ancombc_{name}.qza')
+    da_barplot_path = os.path.join(output_dir, f'da_barplot_{name}.qzv')
+
+    if is_up_to_date(ancombc_path, table_path, METADATA_FILE):
+        print(f"ancombc_{name}.qza is up to date, reusing it")
+        ancombc_result = Artifact.load(ancombc_path)
+    else:
+        table = Artifact.load(table_path)
+        sample_ids = table.view(biom.Table).ids(axis='sample')
+        metadata_df = sample_metadata_df.loc[sample_metadata_df.index.isin(sample_ids)]
+        metadata_md = Metadata(metadata_df)
+
+        ancombc_result, = composition_actions.ancombc(
+            table=table,
+            metadata=metadata_md,
+            formula='disease_state',
+        )
+        ancombc_result.save(ancombc_path)
+        print(f"Saved: {output_dir}/ancombc_{name}.qza")
+
+    # Redo the barplot when this script (e.g. its threshold) was edited
+    if is_up_to_date(da_barplot_path, ancombc_path, __file__):
+        print(f"da_barplot_{name}.qzv is up to date, skipping")
+    else:
+        da_barplot_viz, = composition_actions.da_barplot(
+            data=ancombc_result,
+            significance_threshold=0.001,
+        )
+        da_barplot_viz.save(da_barplot_path)
+        print(f"Saved: {output_dir}/da_barplot_{name}.qzv")
+
+
+def main():
+    # Load metadata with hyphens in column names replaced by underscores
+    sample_metadata_df = load_underscored_metadata(METADATA_FILE).to_dataframe()
+
+    # The fits are independent: run them in parallel processes.
+    run_parallel(run_ancombc, [(*analysis, sample_metadata_df) for analysis in ANALYSES])
+
+    print("\n" + "="*60)
+    print("All ANCOM-BC analyses completed successfully!")
+    print("="*60)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,152 +2,119 @@
 """
 Script 12: ANCOM-BC Differential Abundance Analysis at Genus Level
 Collapse feature tables to genus level and run ANCOM-BC.
+Each table is collapsed once and then split by sample type (collapsing
+sums counts per genus, so this equals collapsing the Gum/Plaque tables).
+The four tables (ASV/OTU x Gum/Plaque) are analysed in parallel processes.
+Results newer than their inputs are kept (set FORCE_REBUILD=1 to recompute them).
 """
 import os
-import pandas as pd
+import biom
 from qiime2 import Artifact, Metadata
+import qiime2.plugins.feature_table.actions as feature_table_actions
 import qiime2.plugins.taxa.actions as taxa_actions
 import qiime2.plugins.composition.actions as composition_actions
+from _artifact_cache import is_up_to_date, load_underscored_metadata, run_parallel
 
 # Define paths
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 METADATA_FILE = os.path.join(BASE_DIR, 'data', 'processed', 'sample-metadata.tsv')
+ASV_TABLE = os.path.join(BASE_DIR, 'outputs', '07.0_filter-for-div', 'asv-table-bio.qza')
+OTU_TABLE = os.path.join(BASE_DIR, 'outputs', '07.0_filter-for-div', 'otu-table-bio.qza')
 ASV_OUTPUT_DIR = os.path.join(BASE_DIR, 'outputs', '10_ancombc_asv')
 OTU_OUTPUT_DIR = os.path.join(BASE_DIR, 'outputs', '10_ancombc_otu')
 ASV_TAXONOMY = os.path.join(BASE_DIR, 'outputs', '09_taxonomy', 'asv-taxonomy.qza')
 OTU_TAXONOMY = os.path.join(BASE_DIR, 'outputs', '09_taxonomy', 'otu-taxonomy.qza')
 
-# Load taxonomy
-asv_taxonomy = Artifact.load(ASV_TAXONOMY)
-otu_taxonomy = Artifact.load(OTU_TAXONOMY)
-
-# Load metadata and rename columns
-sample_metadata_original = Metadata.load(METADATA_FILE)
-sample_metadata_df = sample_metadata_original.to_dataframe()
-sample_metadata_df.columns = sample_metadata_df.columns.str.replace('-', '_')
-
-print("\n" + "="*60)
-print("Collapsing ASV Gum table to genus level")
-print("="*60)
-
-asv_gum_table = Artifact.load(os.path.join(ASV_OUTPUT_DIR, 'asv_gum_table.qza'))
-gum_sample_ids = asv_gum_table.view(pd.DataFrame).index.tolist()
-gum_metadata_df = sample_metadata_df.loc[sample_metadata_df.index.isin(gum_sample_ids)]
-gum_metadata_md = Metadata(gum_metadata_df)
-
-asv_gum_table_l6, = taxa_actions.collapse(
-    table=asv_gum_table,
-    taxonomy=asv_taxonomy,
-    level=6,
-)
-asv_gum_table_l6.save(os.path.join(ASV_OUTPUT_DIR, 'asv_gum_table_l6.qza'))
-print(f"Saved: {ASV_OUTPUT_DIR}/asv_gum_table_l6.qza")
-
-l6_ancombc_asv_gum, = composition_actions.ancombc(
-    table=asv_gum_table_l6,
-    metadata=gum_metadata_md,
-    formula='disease_state',
-)
-l6_ancombc_asv_gum.save(os.path.join(ASV_OUTPUT_DIR, 'l6_ancombc_asv_gum.qza'))
-print(f"Saved: {ASV_OUTPUT_DIR}/l6_ancombc_asv_gum.qza")
-
-l6_da_barplot_asv_gum_viz, = composition_actions.da_barplot(
-    data=l6_ancombc_asv_gum,
-    significance_threshold=0.001,
-)
-l6_da_barplot_asv_gum_viz.save(os.path.join(ASV_OUTPUT_DIR, 'l6_da_barplot_asv_gum.qzv'))
-print(f"Saved: {ASV_OUTPUT_DIR}/l6_da_barplot_asv_gum.qzv")
-
-print("\n" + "="*60)
-print("Collapsing ASV Plaque table to genus level")
-print("="*60)
-
-asv_plaque_table = Artifact.load(os.path.join(ASV_OUTPUT_DIR, 'asv_plaque_table.qza'))
-plaque_sample_ids = asv_plaque_table.view(pd.DataFrame).index.tolist()
-plaque_metadata_df = sample_metadata_df.loc[sample_metadata_df.index.isin(plaque_sample_ids)]
-plaque_metadata_md = Metadata(plaque_metadata_df)
-
-asv_plaque_table_l6, = taxa_actions.collapse(
-    table=asv_plaque_table,
-    taxonomy=asv_taxonomy,
-    level=6,
-)
-asv_plaque_table_l6.save(os.path.join(ASV_OUTPUT_DIR, 'asv_plaque_table_l6.qza'))
-print(f"Saved: {ASV_OUTPUT_DIR}/asv_plaque_table_l6.qza")
-
-l6_ancombc_asv_plaque, = composition_actions.ancombc(
-    table=asv_plaque_table_l6,
-    metadata=plaque_metadata_md,
-    formula='disease_state',
-)
-l6_ancombc_asv_plaque.save(os.path.join(ASV_OUTPUT_DIR, 'l6_ancombc_asv_plaque.qza'))
-print(f"Saved: {ASV_OUTPUT_DIR}/l6_ancombc_asv_plaque.qza")
-
-l6_da_barplot_asv_plaque_viz, = composition_actions.da_barplot(
-    data=l6_ancombc_asv_plaque,
-    significance_threshold=0.001,
-)
-l6_da_barplot_asv_plaque_viz.save(os.path.join(ASV_OUTPUT_DIR, 'l6_da_barplot_asv_plaque.qzv'))
-print(f"Saved: {ASV_OUTPUT_DIR}/l6_da_barplot_asv_plaque.qzv")
-
-print("\n" + "="*60)
-print("Collapsing OTU Gum table to genus level")
-print("="*60)
-
-otu_gum_table = Artifact.load(os.path.join(OTU_OUTPUT_DIR, 'otu_gum_table.qza'))
-
-otu_gum_table_l6, = taxa_actions.collapse(
-    table=otu_gum_table,
-    taxonomy=otu_taxonomy,
-    level=6,
-)
-otu_gum_table_l6.save(os.path.join(OTU_OUTPUT_DIR, 'otu_gum_table_l6.qza'))
-print(f"Saved: {OTU_OUTPUT_DIR}/otu_gum_table_l6.qza")
-
-l6_ancombc_otu_gum, = composition_actions.ancombc(
-    table=otu_gum_table_l6,
-    metadata=gum_metadata_md,
-    formula='disease_state',
-)
-l6_ancombc_otu_gum.save(os.path.join(OTU_OUTPUT_DIR, 'l6_ancombc_otu_gum.qza'))
-print(f"Saved: {OTU_OUTPUT_DIR}/l6_ancombc_otu_gum.qza")
-
-l6_da_barplot_otu_gum_viz, = composition_actions.da_barplot(
-    data=l6_ancombc_otu_gum,
-    significance_threshold=0.001,
-)
-l6_da_barplot_otu_gum_viz.save(os.path.join(OTU_OUTPUT_DIR, 'l6_da_barplot_otu_gum.qzv'))
-print(f"Saved: {OTU_OUTPUT_DIR}/l6_da_barplot_otu_gum.qzv")
-
-print("\n" + "="*60)
-print("Collapsing OTU Plaque table to genus level")
-print("="*60)
-
-otu_plaque_table = Artifact.load(os.path.join(OTU_OUTPUT_DIR, 'otu_plaque_table.qza'))
-
-otu_plaque_table_l6, = taxa_actions.collapse(
-    table=otu_plaque_table,
-    taxonomy=otu_taxonomy,
-    level=6,
-)
-otu_plaque_table_l6.save(os.path.join(OTU_OUTPUT_DIR, 'otu_plaque_table_l6.qza'))
-print(f"Saved: {OTU_OUTPUT_DIR}/otu_plaque_table_l6.qza")
-
-l6_ancombc_otu_plaque, = composition_actions.ancombc(
-    table=otu_plaque_table_l6,
-    metadata=plaque_metadata_md,
-    formula='disease_state',
-)
-l6_ancombc_otu_plaque.save(os.path.join(OTU_OUTPUT_DIR, 'l6_ancombc_otu_plaque.qza'))
-print(f"Saved: {OTU_OUTPUT_DIR}/l6_ancombc_otu_plaque.qza")
-
-l6_da_barplot_otu_plaque_viz, = composition_actions.da_barplot(
-    data=l6_ancombc_otu_plaque,
-    significance_threshold=0.001,
-)
-l6_da_barplot_otu_plaque_viz.save(os.path.join(OTU_OUTPUT_DIR, 'l6_da_barplot_otu_plaque.qzv'))
-print(f"Saved: {OTU_OUTPUT_DIR}/l6_da_barplot_otu_plaque.qzv")
-
-print("\n" + "="*60)
-print("All genus-level ANCOM-BC analyses completed successfully!")
-print("="*60)
\ No newline at end of file
+# (table, taxonomy, output directory, prefix, label) of each approach
+APPROACHES = [
+    (ASV_TABLE, ASV_TAXONOMY, ASV_OUTPUT_DIR, 'asv', 'ASV'),
+    (OTU_TABLE, OTU_TAXONOMY, OTU_OUTPUT_DIR, 'otu', 'OTU'),
+]
+SAMPLE_TYPES = ['Gum', 'Plaque']
+
+
+def run_genus_ancombc(output_dir, name, label, sample_type, sample_metadata_df):
+    """Run ANCOM-BC and the DA barplot on one genus-level table."""
+    print("\n" + "="*60)
+    print(f"Running genus-level ANCOM-BC on {sample_type} samples ({label})")
+    print("="*60)
+
+    table_l6_path = os.path.join(output_dir, f'{name}_table_l6.qza')
+    l6_ancombc_path = os.path.join(output_dir, f'l6_ancombc_{name}.qza')
+    l6_da_barplot_path = os.path.join(output_dir, f'l6_da_barplot_{name}.qzv')
+
+    if is_up_to_date(l6_ancombc_path, table_l6_path, METADATA_FILE):
+        print(f"l6_ancombc_{name}.qza is up to date, reusing it")
+        l6_ancombc_result = Artifact.load(l6_ancombc_path)
+    else:
+        table_l6 = Artifact.load(table_l6_path)
+        sample_ids = table_l6.view(biom.Table).ids(axis='sample')
+        metadata_df = sample_metadata_df.loc[sample_metadata_df.index.isin(sample_ids)]
+        metadata_md = Metadata(metadata_df)
+
+        l6_ancombc_result, = composition_actions.ancombc(
+            table=table_l6,
+            metadata=metadata_md,
+            formula='disease_state',
+        )
+        l6_ancombc_result.save(l6_ancombc_path)
+        print(f"Saved: {output_dir}/l6_ancombc_{name}.qza")
+
+    # Redo the barplot when this script (e.g. its threshold) was edited
+    if is_up_to_date(l6_da_barplot_path, l6_ancombc_path, __file__):
+        print(f"l6_da_barplot_{name}.qzv is up to date, skipping")
+    else:
+        l6_da_barplot_viz, = composition_actions.da_barplot(
+            data=l6_ancombc_result,
+            significance_threshold=0.001,
+        )
+        l6_da_barplot_viz.save(l6_da_barplot_path)
+        print(f"Saved: {output_dir}/l6_da_barplot_{name}.qzv")
+
+
+def main():
+    # Load metadata with hyphens in column names replaced by underscores
+    sample_metadata_md = load_underscored_metadata(METADATA_FILE)
+    sample_metadata_df = sample_metadata_md.to_dataframe()
+
+    analyses = []
+    for table_path, taxonomy_path, output_dir, prefix, label in APPROACHES:
+        names = [f'{prefix}_{sample_type.lower()}' for sample_type in SAMPLE_TYPES]
+        analyses.extend((output_dir, name, label, sample_type)
+                        for name, sample_type in zip(names, SAMPLE_TYPES))
+
+        if all(is_up_to_date(os.path.join(output_dir, f'{name}_table_l6.qza'),
+                             table_path, taxonomy_path, METADATA_FILE)
+               for name in names):
+            print(f"\n{label} genus-level tables are up to date, skipping collapse")
+            continue
+
+        print("\n" + "="*60)
+        print(f"Collapsing {label} table to genus level")
+        print("="*60)
+
+        table_l6, = taxa_actions.collapse(
+            table=Artifact.load(table_path),
+            taxonomy=Artifact.load(taxonomy_path),
+            level=6,
+        )
+
+        for name, sample_type in zip(names, SAMPLE_TYPES):
+            sample_type_table_l6, = feature_table_actions.filter_samples(
+                table=table_l6,
+                metadata=sample_metadata_md,
+                where=f'[sample_type]="{sample_type}"',
+            )
+            sample_type_table_l6.save(os.path.join(output_dir, f'{name}_table_l6.qza'))
+            print(f"Saved: {output_dir}/{name}_table_l6.qza")
+
+    # The fits are independent: run them in parallel processes.
+    run_parallel(run_genus_ancombc, [(*analysis, sample_metadata_df) for analysis in analyses])
+
+    print("\n" + "="*60)
+    print("All genus-level ANCOM-BC analyses completed successfully!")
+    print("="*60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Shared helper: cached loading and batched saving of QIIME2 artifacts.
+
+Artifact.load() extracts the .qza archive and verifies it on every call, and
+Metadata.load() re-parses and re-validates the TSV. Scripts (and
+run_pipeline.py) that load the same file more than once in a single Python
+process use load() / load_metadata() instead to get the already loaded
+object back. The cache key includes the file's modification time, so a
+file that is rewritten on disk is loaded again.
+
+save_all() writes several results at once; zipping an archive is mostly
+zlib and file I/O, which release the GIL, so the saves overlap in threads.
+Saved .qza artifacts are remembered, so a later load() of the same file in
+this process (e.g. the next step in run_pipeline.py) gets the in-memory
+Artifact back instead of extracting the archive again.
+
+is_up_to_date() lets a step skip outputs that are newer than their inputs;
+FORCE_REBUILD=1 turns this off.
+
+run_parallel() runs independent jobs (e.g. the ASV and OTU approaches) in
+separate processes. The workers are started with 'spawn' so each one gets a
+fresh QIIME2 plugin manager instead of a forked copy of the parent's; the
+job function must therefore live in an importable module, not in a script
+loaded by run_pipeline.py under another name.
+
+qiime2 is only imported on the first load, so importing this module is cheap.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+
+
+# Artifacts written by save_all() in this process, by (path, mtime)
+_saved = {}
+
+# Set FORCE_REBUILD=1 to recompute outputs even if they are up to date
+FORCE_REBUILD = os.environ.get('FORCE_REBUILD') == '1'
+
+
+@lru_cache(maxsize=32)
+def _load_artifact(path, mtime_ns):
+    """Load an artifact; cached per (path, modification time)."""
+    from qiime2 import Artifact
+    return Artifact.load(path)
+
+
+@lru_cache(maxsize=4)
+def _load_metadata(path, mtime_ns):
+    """Load a metadata file; cached per (path, modification time)."""
+    from qiime2 import Metadata
+    return Metadata.load(path)
+
+
+@lru_cache(maxsize=4)
+def _load_underscored_metadata(path, mtime_ns):
+    """Metadata with '-' in column names replaced by '_'; cached like above."""
+    from qiime2 import Metadata
+    df = _load_metadata(path, mtime_ns).to_dataframe()
+    df.rename(columns=lambda name: name.replace('-', '_'), inplace=True)
+    return Metadata(df)
+
+
+def load(path):
+    """Load a .qza file, reusing the Artifact if it was loaded or saved before."""
+    key = (os.path.abspath(path), os.stat(path).st_mtime_ns)
+    if key in _saved:
+        return _saved[key]
+    return _load_artifact(*key)
+
+
+def load_metadata(path):
+    """Load a metadata TSV, reusing the Metadata if it was loaded before."""
+    path = os.path.abspath(path)
+    return _load_metadata(path, os.stat(path).st_mtime_ns)
+
+
+def load_underscored_metadata(path):
+    """
+    Load a metadata TSV with '-' in column names replaced by '_'.
+
+    The ANCOM-BC steps (NEW_10.x) need this because '-' is not allowed in
+    where-clauses and formulas.
+    """
+    path = os.path.abspath(path)
+    return _load_underscored_metadata(path, os.stat(path).st_mtime_ns)
+
+
+def is_up_to_date(output_path, *input_paths):
+    """True if output_path exists and is newer than all input paths."""
+    if FORCE_REBUILD or not os.path.exists(output_path):
+        return False
+    output_mtime = os.path.getmtime(output_path)
+    return all(output_mtime > os.path.getmtime(path) for path in input_paths)
+
+
+def save_all(pending, max_workers=4):
+    """Save (artifact or visualization, path) pairs concurrently."""
+    if not pending:
+        return
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(pending))) as executor:
+        for _ in executor.map(lambda item: item[0].save(item[1]), pending):
+            pass
+    for result, path in pending:
+        if path.endswith('.qza'):
+            _saved[(os.path.abspath(path), os.stat(path).st_mtime_ns)] = result
+
+
+def run_parallel(fn, jobs):
+    """Call fn(*job) for every job in its own process; return the results in job order."""
+    jobs = list(jobs)
+    if not jobs:
+        return []
+    with ProcessPoolExecutor(max_workers=len(jobs),
+                             mp_context=multiprocessing.get_context('spawn')) as executor:
+        futures = [executor.submit(fn, *job) for job in jobs]
+        return [future.result() for future in futures]
@@ -0,0 +1,42 @@
+"""
+Shared helper: download large reference files with aria2c, falling back to wget.
+
+download() writes to <dest>.part and only renames it to dest once the
+download succeeded, so a failed or interrupted download never leaves a
+truncated file at dest. An interrupted download is resumed (-c) on the next
+run. aria2c uses 8 parallel connections; wget is used if aria2c is not
+installed or fails.
+"""
+
+import os
+import subprocess
+
+
+def download(url, dest):
+    """Download url to dest via a .part file."""
+    dest = os.fspath(dest)
+    part_path = dest + '.part'
+    try:
+        subprocess.run(
+            ['aria2c', '-c', '-x', '8', '-s', '8', '-k', '1M',
+             '--auto-file-renaming=false',
+             '-d', os.path.dirname(part_path), '-o', os.path.basename(part_path),
+             url],
+            check=True
+        )
+    except (FileNotFoundError, subprocess.CalledProcessError) as e:
+        if isinstance(e, FileNotFoundError):
+            print("aria2c not found, falling back to wget")
+        else:
+            print("aria2c failed, falling back to wget")
+        # aria2c writes segments out of order, so wget cannot resume its
+        # partial file; start over instead
+        if os.path.exists(part_path + '.aria2'):
+            os.remove(part_path + '.aria2')
+            if os.path.exists(part_path):
+                os.remove(part_path)
+        subprocess.run(
+            ['wget', '-c', '-O', part_path, url],
+            check=True
+        )
+    os.replace(part_path, dest)
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Pipeline driver: DADA2 post-processing to core diversity metrics (Tasks 4.1 - 7.1)
+Runs the steps that follow DADA2 denoising in a single process.
+
+Each .qza artifact and the sample metadata are loaded exactly once and
+passed as Python objects to the individual scripts:
+- 04.1_dada2-metadata.py: denoising-stats visualization
+- 04.2_vsearch.py: OTU clustering of the DADA2 output
+- 04.3_ftable-fdata.py: feature-table and rep-seqs summaries (ASV + OTU)
+- 05_filter-ftable.py: rare-feature filtering (ASV + OTU)
+- 07.0_filter-for-div.py: control-sample removal (ASV + OTU)
+- 07_phylo-trees.py: MAFFT/FastTree phylogeny (ASV + OTU)
+- 07.1_a-b-div.py: core diversity metrics (ASV + OTU)
+
+Steps 05 - 7.1 load their inputs through _artifact_cache. Artifacts saved
+by an earlier step are handed to the next one in memory, so the filtered
+tables, sequences and trees are written once but never re-extracted.
+Task 6 is not included (no negative control is left after denoising, see
+README). The significance tests (7.1.1, 7.1.2) run their own process pools
+and are run separately afterwards.
+
+The individual scripts can still be run on their own.
+"""
+
+import os
+import importlib.util
+from _artifact_cache import load as load_artifact, load_metadata
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_script(filename):
+    """Import a pipeline script by file name (names start with digits)."""
+
+    module_name = 'step_' + os.path.splitext(filename)[0].replace('.', '_').replace('-', '_')
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(SCRIPTS_DIR, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+dada2_stats = load_script('04.1_dada2-metadata.py')
+vsearch_step = load_script('04.2_vsearch.py')
+summaries = load_script('04.3_ftable-fdata.py')
+filtering = load_script('05_filter-ftable.py')
+controls = load_script('07.0_filter-for-div.py')
+phylo = load_script('07_phylo-trees.py')
+core_metrics = load_script('07.1_a-b-div.py')
+
+
+def main():
+    """Run Tasks 4.1 (stats visualization) to 7.1 in one process."""
+
+    print("\n" + "="*60)
+    print("PIPELINE: TASKS 4.1 - 7.1")
+    print("="*60 + "\n")
+
+    for path in (vsearch_step.TABLE_ARTIFACT, vsearch_step.REP_SEQS_ARTIFACT):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Run Task 4.1 (DADA2) first: {path}")
+    if not os.path.exists(summaries.METADATA_FILE):
+        raise FileNotFoundError(f"Metadata file not found: {summaries.METADATA_FILE}")
+
+    # Load every input once
+    print("Loading inputs...")
+    dada2_table = load_artifact(vsearch_step.TABLE_ARTIFACT)
+    dada2_seqs = load_artifact(vsearch_step.REP_SEQS_ARTIFACT)
+    metadata = load_metadata(summaries.METADATA_FILE)
+
+    all_outputs = []
+
+    # Task 4.1: denoising statistics
+    if os.path.exists(dada2_stats.STATS_FILE):
+        all_outputs.append(dada2_stats.tabulate_stats(load_artifact(dada2_stats.STATS_FILE)))
+    else:
+        print(f"\n⚠️  Denoising stats not found, skipping: {dada2_stats.STATS_FILE}")
+
+    # Task 4.2: vsearch clustering on the in-memory DADA2 artifacts
+    clustering_results = vsearch_step.run(dada2_table, dada2_seqs)
+
+    # Task 4.3: summaries for both approaches
+    all_outputs.extend(summaries.summarize(
+        dada2_table,
+        dada2_seqs,
+        metadata,
+        'dada2-asv',
+        'DADA2 (ASVs)'
+    ))
+    all_outputs.extend(summaries.summarize(
+        clustering_results.clustered_table,
+        clustering_results.clustered_sequences,
+        metadata,
+        'vsearch-otu',
+        'vsearch (OTUs)'
+    ))
+
+    # Task 5: rare-feature filtering (DADA2 table is served from the cache)
+    all_outputs.extend(filtering.filter_features(
+        filtering.DADA2_TABLE,
+        filtering.DADA2_SEQS,
+        filtering.OUTPUT_DIR,
+        'dada2-asv',
+        'DADA2 (ASVs)',
+        metadata
+    ))
+    all_outputs.extend(filtering.filter_features(
+        filtering.VSEARCH_TABLE,
+        filtering.VSEARCH_SEQS,
+        filtering.OUTPUT_DIR,
+        'vsearch-otu',
+        'vsearch (OTUs)',
+        metadata
+    ))
+
+    # Task 7.0: remove control samples
+    all_outputs.extend(controls.filter_controls(
+        controls.ASV_TABLE,
+        controls.ASV_SEQS,
+        'asv',
+        'ASV (DADA2)',
+        metadata
+    ))
+    all_outputs.extend(controls.filter_controls(
+        controls.OTU_TABLE,
+        controls.OTU_SEQS,
+        'otu',
+        'OTU (vsearch)',
+        metadata
+    ))
+
+    # Task 7: phylogenetic trees from the bio-only sequences
+    # (steps 7 and 7.1 run one approach at a time here, so each uses all cores)
+    all_outputs.extend(phylo.build_phylogeny(phylo.ASV_SEQS, 'asv', 'ASV (DADA2)'))
+    all_outputs.extend(phylo.build_phylogeny(phylo.OTU_SEQS, 'otu', 'OTU (vsearch)'))
+
+    # Task 7.1: core diversity metrics on the tables and trees from above
+    all_outputs.append(core_metrics.run_core_metrics(
+        core_metrics.ASV_TABLE,
+        core_metrics.ASV_TREE,
+        'asv-core-metrics',
+        'ASV (DADA2)',
+        metadata
+    ))
+    all_outputs.append(core_metrics.run_core_metrics(
+        core_metrics.OTU_TABLE,
+        core_metrics.OTU_TREE,
+        'otu-core-metrics',
+        'OTU (vsearch)',
+        metadata
+    ))
+
+    # Final summary
+    print("\n" + "="*60)
+    print("✓ PIPELINE COMPLETE: Tasks 4.1 - 7.1")
+    print("="*60)
+    print(f"\nGenerated files ({len(all_outputs)}):")
+    for output in all_outputs:
+        print(f"  - {os.path.basename(output)}")
+    print("="*60)
+
+
+if __name__ == "__main__":
+    main()